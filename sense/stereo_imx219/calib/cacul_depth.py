@@ -179,6 +179,12 @@ class DepthCalculator:
         
         print("[运行] 按 'q' 退出")
         
+        # 显示画布（左右并排）只分配一次，校正结果直接写进左右两半，检测完在上面画
+        h, w = self.map1_left.shape[:2]
+        display = np.empty((h, w * 2, 3), np.uint8)
+        display_left = display[:, :w]
+        display_right = display[:, w:]
+        
         try:
             while True:
                 # 采集双目图像
@@ -186,17 +192,13 @@ class DepthCalculator:
                 frame_right = cam_right.capture_array()
                 
                 # 校正图像
-                left_rect = cv2.remap(frame_left, self.map1_left, self.map2_left, cv2.INTER_LINEAR)
-                right_rect = cv2.remap(frame_right, self.map1_right, self.map2_right, cv2.INTER_LINEAR)
+                left_rect = cv2.remap(frame_left, self.map1_left, self.map2_left, cv2.INTER_LINEAR, dst=display_left)
+                right_rect = cv2.remap(frame_right, self.map1_right, self.map2_right, cv2.INTER_LINEAR, dst=display_right)
                 
                 # 检测红色点
                 left_point = self.detect_red_spot(left_rect)
                 right_point = self.detect_red_spot(right_rect)
                 
-                # 显示
-                display_left = left_rect.copy()
-                display_right = right_rect.copy()
-                
                 # 绘制检测结果
                 if left_point:
                     cv2.circle(display_left, left_point, 10, (0, 0, 255), 2)
@@ -229,8 +231,7 @@ class DepthCalculator:
                         print(f"\r3D坐标: X={X:7.1f}mm, Y={Y:7.1f}mm, Z={Z:7.1f}mm, 视差={disparity:5.1f}px",
                               end='', flush=True)
                 
-                # 拼接显示
-                display = np.hstack([display_left, display_right])
+                # 显示（检测结果已画在画布左右两半上）
                 cv2.imshow('Red Spot Depth Calculation (CSI)', display)
                 
                 if cv2.waitKey(1) & 0xFF == ord('q'):
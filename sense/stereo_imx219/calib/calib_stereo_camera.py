@@ -70,6 +70,7 @@ class StereoCalibrator:
         cam_right.start()
         
         count = 0
+        display = None  # 显示画布（左右并排），第一帧时分配，之后每帧复用
         print(f"\n[采集] 按空格拍摄，需要 {num_images} 张图像")
         
         try:
@@ -84,15 +85,18 @@ class StereoCalibrator:
                 ret_left, corners_left = cv2.findChessboardCorners(gray_left, self.pattern_size, None)
                 ret_right, corners_right = cv2.findChessboardCorners(gray_right, self.pattern_size, None)
                 
-                # 显示
-                display_left = left.copy()
-                display_right = right.copy()
+                # 显示（拷贝到画布左右两半再画角点，保存的原图不受影响）
+                if display is None:
+                    display = np.empty((left.shape[0], left.shape[1] * 2) + left.shape[2:], left.dtype)
+                display_left = display[:, :left.shape[1]]
+                display_right = display[:, left.shape[1]:]
+                np.copyto(display_left, left)
+                np.copyto(display_right, right)
                 if ret_left:
                     cv2.drawChessboardCorners(display_left, self.pattern_size, corners_left, ret_left)
                 if ret_right:
                     cv2.drawChessboardCorners(display_right, self.pattern_size, corners_right, ret_right)
                 
-                display = np.hstack([display_left, display_right])
                 cv2.putText(display, f"Captured: {count}/{num_images}", (10, 30),
                            cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
                 cv2.imshow('Stereo Calibration - Press SPACE to capture', display)
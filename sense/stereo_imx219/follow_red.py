@@ -6,6 +6,7 @@
 
 import sys
 import os
+import select
 # 添加项目根目录到Python路径
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
@@ -48,6 +49,10 @@ class RedTrackerCSI:
         
         # 检测阈值
         self.threshold = 100
+        # 红色差值权重（BGR）：2R - G - B，用于 cv2.transform
+        self._red_weights = np.array([[-1.0, -1.0, 2.0]], np.float32)
+        # 去噪用的3x3结构元素（只创建一次）
+        self._kernel3 = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
         
         # 显示开关
         # self.show_display = True
@@ -59,6 +64,10 @@ class RedTrackerCSI:
         # 是否使用形态学去噪（关闭可提升速度，适合清晰红点）
         self.use_morphology = False  # True=去噪（精确）, False=跳过（极速）
         
+        # 是否使用OpenCL（T-API，集成显卡加速校正/检测），没有OpenCL设备时自动关闭
+        self.use_opencl = cv2.ocl.haveOpenCL()
+        cv2.ocl.setUseOpenCL(self.use_opencl)
+        
         # 标定深度（仿射变换标定时的深度）
         self.calibration_depth = 1000.0  # mm
         
@@ -72,6 +81,7 @@ class RedTrackerCSI:
         print(f"[提示] 仿射变换标定深度: {self.calibration_depth}mm")
         print(f"[优化] 校正: {'开' if self.use_rectification else '关'} | "
               f"形态学去噪: {'开' if self.use_morphology else '关'} | "
+              f"OpenCL: {'开' if self.use_opencl else '关'} | "
               f"图像显示: {'开' if self.show_display else '关'}")
     
     def _init_cameras(self):
@@ -115,22 +125,43 @@ class RedTrackerCSI:
         
         print(f"[相机] 分辨率: {RESOLUTION}, 帧率: {FPS} fps")
     
-    def detect_red(self, frame):
-        """检测红色点（优化版）"""
-        # 优化1: 避免split，直接用整数运算（比float32快）
-        # frame是BGR格式：frame[:,:,0]=B, frame[:,:,1]=G, frame[:,:,2]=R
-        b = frame[:, :, 0].astype(np.int16)
-        g = frame[:, :, 1].astype(np.int16)
-        r = frame[:, :, 2].astype(np.int16)
+    @staticmethod
+    def _pixel(img, pt):
+        """读取像素BGR值（UMat时只下载这一个像素）"""
+        x, y = pt
+        if isinstance(img, cv2.UMat):
+            return cv2.UMat(img, (y, y + 1), (x, x + 1)).get()[0, 0]
+        return img[y, x]
+    
+    def _poll_key(self):
+        """读取按键
         
-        # 红色检测：R - (G+B)/2 > threshold
-        red_diff = r - ((g + b) >> 1)  # 右移1位 = 除以2，更快
-        mask = (red_diff > self.threshold).astype(np.uint8) * 255
+        显示开启时用 waitKey（同时刷新窗口）；关闭时不再调用 waitKey，
+        改为非阻塞检查终端输入（输入后回车），省掉每帧约1ms的GUI事件等待
+        """
+        if self.show_display:
+            return cv2.waitKey(1) & 0xFF
+        if select.select([sys.stdin], [], [], 0)[0]:
+            line = sys.stdin.readline().strip()
+            if line:
+                return ord(line[0])
+        return 0xFF
+    
+    def detect_red(self, frame):
+        """检测红色点（优化版，frame 可以是 numpy 数组或 cv2.UMat）"""
+        # 优化1: 避免split和类型转换，cv2.transform 一次遍历完成通道加权（支持OpenCL）
+        # frame是BGR格式，红色检测：R - (G+B)/2 > threshold  等价于  2R - G - B > 2*threshold
+        # 结果饱和到uint8（2*threshold < 255 时比较结果不变）
+        red_diff = cv2.transform(frame, self._red_weights)
+        _, mask = cv2.threshold(red_diff, 2 * self.threshold, 255, cv2.THRESH_BINARY)
         
         # 优化2: 可选的形态学去噪
         if self.use_morphology:
-            kernel = np.ones((3, 3), np.uint8)
-            mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+            mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self._kernel3)
+        
+        # findContours 只接受Mat，这里才从设备下载掩码
+        if isinstance(mask, cv2.UMat):
+            mask = mask.get()
         
         # 优化3: 查找轮廓
         contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -176,7 +207,7 @@ class RedTrackerCSI:
     def run(self):
         """运行跟踪"""
         print("\n[运行] 控制:")
-        print("  'd': 切换图像显示")
+        print("  'd': 切换图像显示（关闭显示后在终端输入 d/q 并回车）")
         print("  'q': 退出")
         
         while True:
@@ -186,6 +217,8 @@ class RedTrackerCSI:
             t0 = time.perf_counter()
             frame_left = self.cam_left.capture_array()
             frame_right = self.cam_right.capture_array()
+            if self.use_opencl:
+                frame_left, frame_right = cv2.UMat(frame_left), cv2.UMat(frame_right)
             t_capture = (time.perf_counter() - t0) * 1000  # ms
 
             # 校正图像（可选）
@@ -207,7 +240,7 @@ class RedTrackerCSI:
             # 显示图像（如果开启）
             t0 = time.perf_counter()
             if self.show_display:
-                display = left.copy()
+                display = left.get() if isinstance(left, cv2.UMat) else left.copy()
                 
                 # 绘制红色点
                 if left_pt:
@@ -218,7 +251,7 @@ class RedTrackerCSI:
                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
                     
                     # 显示RGB值和红色差值
-                    b, g, r = left[left_pt[1], left_pt[0]]
+                    b, g, r = self._pixel(left, left_pt)
                     red_diff = r - (g + b) / 2
                     cv2.putText(display, f"RGB: ({r}, {g}, {b})", (10, 60),
                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
@@ -254,7 +287,7 @@ class RedTrackerCSI:
                         t_move = (time.perf_counter() - t0) * 1000  # ms
                         
                         # 获取RGB值和红色差值
-                        b, g, r = left[left_pt[1], left_pt[0]]
+                        b, g, r = self._pixel(left, left_pt)
                         red_diff = r - (g + b) / 2
                         
                         # 总循环时间（不包括waitKey，因为它在后面）
@@ -279,9 +312,9 @@ class RedTrackerCSI:
                 else:
                     print("\r[警告] 视差无效，无法计算3D坐标", end='', flush=True)
             
-            # 等待键盘输入（也会刷新窗口显示）
+            # 读取按键（显示开启时也会刷新窗口）
             t0 = time.perf_counter()
-            key = cv2.waitKey(1) & 0xFF
+            key = self._poll_key()
             t_waitkey = (time.perf_counter() - t0) * 1000  # ms
             
             if key == ord('q'):
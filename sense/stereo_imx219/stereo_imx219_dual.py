@@ -129,6 +129,7 @@ class StereoCamera:
     def run(self):
         """运行采集循环"""
         frame_count = 0
+        combined = None  # 双目并排显示画布，第一帧时分配，之后每帧复用
         
         while True:
             frames = []
@@ -146,8 +147,12 @@ class StereoCamera:
                     # 单个相机
                     cv2.imshow(frames[0][0], frames[0][1])
                 elif len(frames) == 2:
-                    # 双目相机，并排显示
-                    combined = np.hstack([frames[0][1], frames[1][1]])
+                    # 双目相机，并排显示（拷贝进预分配画布的左右两半）
+                    left, right = frames[0][1], frames[1][1]
+                    if combined is None:
+                        combined = np.empty((left.shape[0], left.shape[1] * 2) + left.shape[2:], left.dtype)
+                    np.copyto(combined[:, :left.shape[1]], left)
+                    np.copyto(combined[:, left.shape[1]:], right)
                     cv2.imshow('Stereo Camera', combined)
             
             # 键盘控制
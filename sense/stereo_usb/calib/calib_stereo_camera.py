@@ -51,6 +51,7 @@ class StereoCalibrator:
         cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
         
         count = 0
+        display = None  # 显示画布，第一帧时按帧尺寸分配，之后每帧复用
         print(f"\n[采集] 按空格拍摄，需要 {num_images} 张图像")
         
         while count < num_images:
@@ -68,15 +69,17 @@ class StereoCalibrator:
             ret_left, corners_left = cv2.findChessboardCorners(gray_left, self.pattern_size, None)
             ret_right, corners_right = cv2.findChessboardCorners(gray_right, self.pattern_size, None)
             
-            # 显示
-            display_left = left.copy()
-            display_right = right.copy()
+            # 显示（拷贝到画布上再画角点，保存的原图不受影响；左右两半是画布的视图）
+            if display is None:
+                display = np.empty_like(frame)
+            np.copyto(display, frame)
+            display_left = display[:, :1280]
+            display_right = display[:, 1280:]
             if ret_left:
                 cv2.drawChessboardCorners(display_left, self.pattern_size, corners_left, ret_left)
             if ret_right:
                 cv2.drawChessboardCorners(display_right, self.pattern_size, corners_right, ret_right)
             
-            display = np.hstack([display_left, display_right])
             cv2.putText(display, f"Captured: {count}/{num_images}", (10, 30),
                        cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
             cv2.imshow('Stereo Calibration - Press SPACE to capture', display)
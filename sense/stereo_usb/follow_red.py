@@ -6,6 +6,7 @@
 
 import sys
 import os
+import select
 # 添加项目根目录到Python路径
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
@@ -34,29 +35,66 @@ class RedTracker:
         self.map2_left = maps['map2_left']
         self.map1_right = maps['map1_right']
         self.map2_right = maps['map2_right']
+        # 单目图像尺寸（左右图拼接在一帧里，各占一半宽度）
+        self.image_height, self.half_width = self.map1_left.shape[:2]
         
         # 检测阈值
         self.threshold = 50
+        # 红色差值权重（BGR）：2R - G - B，用于 cv2.transform
+        self._red_weights = np.array([[-1.0, -1.0, 2.0]], np.float32)
+        # 去噪用的3x3结构元素（只创建一次）
+        self._kernel3 = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
         
         # 显示开关
         self.show_display = True
         
+        # OpenCL加速（T-API）：校正/红色检测/形态学在集成显卡上运行，没有OpenCL设备时走CPU
+        self.use_opencl = cv2.ocl.haveOpenCL()
+        cv2.ocl.setUseOpenCL(self.use_opencl)
+        
+        # 校正后的左右拼接图（只分配一次），左右图的红色检测在整幅图上一次完成
+        rect_size = (self.image_height, 2 * self.half_width)
+        if self.use_opencl:
+            self.rectified = cv2.UMat(*rect_size, cv2.CV_8UC3)
+        else:
+            self.rectified = np.empty((*rect_size, 3), np.uint8)
+        
         print("[跟踪器] 已启动")
+        print(f"[优化] OpenCL: {'开' if self.use_opencl else '关'}")
     
-    def detect_red(self, frame):
-        """检测红色点"""
-        b, g, r = cv2.split(frame)
-        b = b.astype(np.float32)
-        g = g.astype(np.float32)
-        r = r.astype(np.float32)
-        
-        # 红色检测
-        mask = (r - (g + b) / 2 > self.threshold).astype(np.uint8) * 255
+    @staticmethod
+    def _pixel(img, pt):
+        """读取像素BGR值（UMat时只下载这一个像素）"""
+        x, y = pt
+        if isinstance(img, cv2.UMat):
+            return cv2.UMat(img, (y, y + 1), (x, x + 1)).get()[0, 0]
+        return img[y, x]
+    
+    def _halves(self, img):
+        """左右半幅（视图，不拷贝；支持 numpy 数组和 cv2.UMat）"""
+        w = self.half_width
+        if isinstance(img, cv2.UMat):
+            rows = (0, self.image_height)
+            return cv2.UMat(img, rows, (0, w)), cv2.UMat(img, rows, (w, 2 * w))
+        return img[:, :w], img[:, w:]
+    
+    def red_mask(self, frame):
+        """红色掩码（frame 可以是 numpy 数组或 cv2.UMat，返回 numpy 数组）"""
+        # 红色检测：R - (G+B)/2 > threshold  等价于  2R - G - B > 2*threshold
+        # transform 一次遍历完成通道加权，结果饱和到uint8（2*threshold < 255 时比较结果不变）
+        red_diff = cv2.transform(frame, self._red_weights)
+        _, mask = cv2.threshold(red_diff, 2 * self.threshold, 255, cv2.THRESH_BINARY)
         
         # 去噪
-        kernel = np.ones((3, 3), np.uint8)
-        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self._kernel3)
         
+        # findContours 只接受Mat，这里才从设备下载掩码
+        if isinstance(mask, cv2.UMat):
+            mask = mask.get()
+        return mask
+    
+    def find_red(self, mask):
+        """在掩码中找最大红色区域的中心"""
         # 查找轮廓
         contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         
@@ -74,6 +112,24 @@ class RedTracker:
         
         return None
     
+    def _poll_key(self):
+        """读取按键
+        
+        显示开启时用 waitKey（同时刷新窗口）；关闭时不再调用 waitKey，
+        改为非阻塞检查终端输入（输入后回车），省掉每帧约1ms的GUI事件等待
+        """
+        if self.show_display:
+            return cv2.waitKey(1) & 0xFF
+        if select.select([sys.stdin], [], [], 0)[0]:
+            line = sys.stdin.readline().strip()
+            if line:
+                return ord(line[0])
+        return 0xFF
+    
+    def detect_red(self, frame):
+        """检测红色点"""
+        return self.find_red(self.red_mask(frame))
+    
     def calculate_3d(self, left_pt, right_pt):
         """计算3D坐标（Y轴反转）"""
         if left_pt is None or right_pt is None:
@@ -98,11 +154,21 @@ class RedTracker:
         # cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
         
         # 2. 高帧率
-        # cap = cv2.VideoCapture(0, cv2.CAP_V4L2)
-        cap = cv2.VideoCapture(16, cv2.CAP_V4L2)
-        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'))
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, 2560)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        # GStreamer：jpegdec 在独立线程解码MJPEG，与主循环的检测重叠；
+        # appsink drop=1 max-buffers=1 只保留最新一帧（相当于 buffer size = 1，降低延迟）
+        gst_pipeline = (
+            "v4l2src device=/dev/video16 ! image/jpeg,width=2560,height=720,framerate=60/1 ! "
+            "jpegdec ! videoconvert ! video/x-raw,format=BGR ! appsink drop=1 max-buffers=1"
+        )
+        cap = cv2.VideoCapture(gst_pipeline, cv2.CAP_GSTREAMER)
+        if not cap.isOpened():
+            # OpenCV 没有编译 GStreamer 支持（如 pip 版）时回退到 V4L2
+            print("[摄像头] GStreamer 不可用，使用 V4L2")
+            # cap = cv2.VideoCapture(0, cv2.CAP_V4L2)
+            cap = cv2.VideoCapture(16, cv2.CAP_V4L2)
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'))
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, 2560)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
         
         # 获取并打印摄像头参数
         fps = cap.get(cv2.CAP_PROP_FPS)
@@ -117,7 +183,7 @@ class RedTracker:
         print(f"  图像格式: {fourcc_str}")
         print()
         print("[运行] 控制:")
-        print("  'd': 切换图像显示")
+        print("  'd': 切换图像显示（关闭显示后在终端输入 d/q 并回车）")
         print("  'q': 退出")
         
         while True:
@@ -125,17 +191,20 @@ class RedTracker:
             if not ret:
                 break
             
-            # 分离左右图像并校正
-            left = cv2.remap(frame[:, :1280], self.map1_left, self.map2_left, cv2.INTER_LINEAR)
-            right = cv2.remap(frame[:, 1280:], self.map1_right, self.map2_right, cv2.INTER_LINEAR)
+            # 分离左右图像并校正，写入拼接缓冲区的左右两半（OpenCL时先上传为UMat，后续运算都在设备端）
+            left_src, right_src = self._halves(cv2.UMat(frame) if self.use_opencl else frame)
+            left, right = self._halves(self.rectified)
+            cv2.remap(left_src, self.map1_left, self.map2_left, cv2.INTER_LINEAR, dst=left)
+            cv2.remap(right_src, self.map1_right, self.map2_right, cv2.INTER_LINEAR, dst=right)
             
-            # 检测红色点
-            left_pt = self.detect_red(left)
-            right_pt = self.detect_red(right)
+            # 检测红色点：整幅拼接图只做一次红色差值/阈值/去噪，再分别找左右中心
+            mask_left, mask_right = self._halves(self.red_mask(self.rectified))
+            left_pt = self.find_red(mask_left)
+            right_pt = self.find_red(mask_right)
             
             # 显示图像（如果开启）
             if self.show_display:
-                display = left.copy()
+                display = left.get() if isinstance(left, cv2.UMat) else left.copy()
                 
                 # 绘制红色点
                 if left_pt:
@@ -146,7 +215,7 @@ class RedTracker:
                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
                     
                     # 显示RGB值和红色差值
-                    b, g, r = left[left_pt[1], left_pt[0]]
+                    b, g, r = self._pixel(left, left_pt)
                     red_diff = r - (g + b) / 2
                     cv2.putText(display, f"RGB: ({r}, {g}, {b})", (10, 60),
                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
@@ -164,7 +233,7 @@ class RedTracker:
                         self.galvo.move_to_physical(target_3d[0] + 27, target_3d[1] - 3)
                         
                         # 获取RGB值和红色差值
-                        b, g, r = left[left_pt[1], left_pt[0]]
+                        b, g, r = self._pixel(left, left_pt)
                         red_diff = r - (g + b) / 2
                         
                         print(f"\r跟踪: ({target_3d[0]:6.1f}, {target_3d[1]:6.1f}, {target_3d[2]:6.1f})mm | "
@@ -173,7 +242,7 @@ class RedTracker:
                     except:
                         pass
             
-            key = cv2.waitKey(1) & 0xFF
+            key = self._poll_key()
             if key == ord('q'):
                 break
             elif key == ord('d'):
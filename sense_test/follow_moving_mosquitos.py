@@ -12,10 +12,22 @@ import numpy as np
 import sys
 import os
 import math
-from collections import deque
+from functools import lru_cache
 import shutil
 import subprocess
 import time
+import queue
+import threading
+
+try:
+    from numba import njit, prange
+except ImportError:  # 没有 numba 时走 OpenCV/NumPy 分步实现
+    njit = None
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # 没有 scipy 时跟踪用 NumPy 距离矩阵
+    cKDTree = None
 
 # ========== 配置参数 ==========
 # 摄像头/视频参数（集中在这里方便改）
@@ -23,13 +35,18 @@ CAM_ID_DEFAULT = 0
 CAM_WIDTH = 640            # 0 表示不强制设置
 CAM_HEIGHT = 480           # 0 表示不强制设置
 CAM_FPS = 30               # 0 表示不强制设置
+CAM_FOURCC = "MJPG"        # 摄像头传输格式（MJPG 压缩后 USB 带宽小很多，默认的 YUYV 容易卡帧率）；空字符串表示不强制设置
 PRINT_CAM_FORMATS = True   # 启动时打印摄像头支持的格式（需要系统安装 v4l2-ctl）
 SHOW_UI = False             # 是否显示窗口（False 时不显示，Ctrl+C 退出）
+THREADED_CAPTURE = True     # 后台线程读摄像头，主循环只取最新一帧（处理慢时丢旧帧，读帧等待和计算重叠）
+USE_NUMBA = True           # 安装了 numba 时，帧差+颜色筛选用融合内核（每个像素只读一次）
+USE_OPENCL = True          # 不走 numba 融合内核时，灰度转换+帧差用 OpenCL（T-API，UMat），需要 OpenCV 支持 OpenCL
 
 # 背景剪切参数
 # 两帧差分参数（适用于相机基本静止）
 DIFF_THRESHOLD = 50         # 帧差阈值（越小越敏感）
 MIN_CHANGE_AREA = 4         # 最小变化区域面积，小于该面积即为噪声
+MOTION_DOWNSCALE = 1        # 帧差在 1/N 分辨率上做（2=长宽减半，数据量 1/4；颜色/形状筛选仍用原图），1=原分辨率
 
 # 颜色筛选参数（黑色）
 BLACK_MAX = 200              # RGB最大值（越小越黑）
@@ -52,6 +69,7 @@ CLIP_POST_FRAMES = 60
 CLIP_DIR = "mosquito_clips"
 CLIP_EXT = ".mp4"
 CLIP_FOURCC_CANDIDATES = ["mp4v", "avc1"]
+CLIP_WRITE_QUEUE = 30       # 片段编码放到后台线程，最多排队的帧数（满了主循环等待，不丢帧）；0 表示在主循环里同步写
 
 def print_camera_formats(cam: int, cap: cv2.VideoCapture | None = None):
     dev = f"/dev/video{cam}"
@@ -78,35 +96,162 @@ def print_camera_formats(cam: int, cap: cv2.VideoCapture | None = None):
         w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0)
         h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0)
         fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
-        print(f"OpenCV backend={backend} current={w}x{h} fps={fps:.1f}")
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC) or 0)
+        fourcc_str = "".join(chr((fourcc >> 8 * i) & 0xFF) for i in range(4)) if fourcc else "?"
+        print(f"OpenCV backend={backend} current={w}x{h} fps={fps:.1f} fourcc={fourcc_str}")
+
 
+_working_fourcc = None  # 第一次成功打开的编码，之后的片段直接用，不再逐个试
 
 def open_clip_writer(path: str, w: int, h: int, fps: float) -> cv2.VideoWriter:
+    global _working_fourcc
     os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if _working_fourcc is not None:
+        out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*_working_fourcc), fps, (w, h))
+        if out.isOpened():
+            return out
     for code in CLIP_FOURCC_CANDIDATES:
+        if code == _working_fourcc:
+            continue
         out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*code), fps, (w, h))
         if out.isOpened():
+            _working_fourcc = code
             return out
     return cv2.VideoWriter()
 
 
+class FrameGrabber:
+    """后台线程连续 cap.read()，只保留最新一帧；接口和 cap.read() 一样返回 (ret, frame)"""
+
+    def __init__(self, cap: cv2.VideoCapture):
+        self.cap = cap
+        self.q = queue.Queue(maxsize=1)
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            while not self.stopped:
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                self._put((ret, frame))
+        finally:
+            # 读完、读失败或 cap.read() 抛异常都放结束标记，主循环不会一直等下去
+            self._put((False, None))
+
+    def _put(self, item):
+        # 只有这一个线程在放，取走旧帧后一定放得进去
+        try:
+            self.q.put_nowait(item)
+        except queue.Full:
+            try:
+                self.q.get_nowait()
+            except queue.Empty:
+                pass
+            self.q.put_nowait(item)
+
+    def read(self):
+        while True:
+            try:
+                return self.q.get(timeout=0.5)
+            except queue.Empty:
+                if not self.thread.is_alive() and self.q.empty():
+                    return False, None
+
+    def stop(self):
+        self.stopped = True
+        self.thread.join(timeout=1.0)
+
+
 class ClipSaver:
-    def __init__(self, out_dir: str, pre_n: int, post_n: int):
+    def __init__(self, out_dir: str, pre_n: int, post_n: int, queue_n: int = 0):
         self.out_dir = out_dir
-        self.pre = deque(maxlen=max(0, int(pre_n)))
+        self.pre_n = max(0, int(pre_n))
         self.post_n = max(0, int(post_n))
         self.writer = None
         self.post_left = 0
         self.clip_idx = 0
+        # 前N帧环形缓存：槽位第一次 push 时按帧尺寸分配，之后每帧拷贝进下一个槽位，不再逐帧分配
+        # 多一个槽位给当前帧，写入当前帧时不会覆盖最早的缓存帧
+        self.ring = None
+        self.head = 0      # 当前帧要写入的槽位
+        self.cached = 0    # 环中有效的前N帧数量
+        # 后台写线程：队列里放 (writer, 槽位下标)，下标为 None 表示写完释放该 writer
+        # 队列里的帧直接引用环形缓存的槽位：pending 记录每个槽位还有几次没写完，
+        # 复用槽位前等它归零（写线程跟不上时主循环等待），环多留 队列长度+1 个槽位，平时不用等
+        self.queue_n = max(0, int(queue_n))
+        self.queue = None
+        self.thread = None
+        self.pending = None
+        self.cond = threading.Condition()
+        if self.queue_n > 0:
+            self.queue = queue.Queue(maxsize=self.queue_n)
+            self.thread = threading.Thread(target=self._write_loop, daemon=True)
+            self.thread.start()
+
+    def _write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            writer, k = item
+            if k is None:
+                writer.release()
+            else:
+                writer.write(self.ring[k])
+                with self.cond:
+                    self.pending[k] -= 1
+                    self.cond.notify_all()
+
+    def _write(self, k):
+        if self.queue is not None:
+            with self.cond:
+                self.pending[k] += 1
+            self.queue.put((self.writer, k))
+        else:
+            self.writer.write(self.ring[k])
 
-    def close(self):
+    def _end_clip(self):
         if self.writer is not None:
-            self.writer.release()
+            if self.queue is not None:
+                self.queue.put((self.writer, None))
+            else:
+                self.writer.release()
             self.writer = None
             self.post_left = 0
 
-    def push(self, frame, detected: bool, fps: float, w: int, h: int, base_name: str, frame_idx: int):
+    def close(self):
+        self._end_clip()
+        if self.thread is not None:
+            self.queue.put(None)  # 等排队的帧都写完
+            self.thread.join()
+            self.thread = None
+            self.queue = None
+
+    def push(self, frame, detected: bool, fps: float, w: int, h: int, base_name: str, frame_idx: int, boxes=()):
         # detected: 本帧是否检测到蚊子
+        # boxes: 要画在保存帧上的矩形框 [(x1, y1, x2, y2), ...]，画在环形缓存的槽位上，不改原帧
+        if self.pre_n == 0 and self.writer is None and not detected:
+            return  # 不缓存前N帧且不在录制：这一帧用不到
+
+        if self.ring is None or self.ring[0].shape != frame.shape:
+            n = self.pre_n + 1 + (self.queue_n + 1 if self.queue is not None else 0)
+            with self.cond:  # 换尺寸前等旧环里排队的帧写完
+                self.cond.wait_for(lambda: not self.pending or not any(self.pending))
+                self.ring = [np.empty_like(frame) for _ in range(n)]
+                self.pending = [0] * n
+            self.head = 0
+            self.cached = 0
+        elif self.queue is not None:
+            with self.cond:  # 这个槽位还在写队列里：等写线程写完再覆盖
+                self.cond.wait_for(lambda: self.pending[self.head] == 0)
+        slot = self.ring[self.head]
+        np.copyto(slot, frame)
+        for x1, y1, x2, y2 in boxes:
+            cv2.rectangle(slot, (x1, y1), (x2, y2), (0, 0, 255), 2)
+
         if detected:
             self.post_left = self.post_n  # 检测到就刷新“后N帧”计数，连续检测会合并成一个片段
             if self.writer is None:
@@ -118,72 +263,179 @@ class ClipSaver:
                 if not self.writer.isOpened():
                     self.writer = None
                 else:
-                    # 写入前N帧缓存
-                    for f in self.pre:
-                        self.writer.write(f)
+                    # 写入前N帧缓存（从最早的一帧开始）
+                    n = len(self.ring)
+                    for k in range(self.head - self.cached, self.head):
+                        self._write(k % n)
 
         if self.writer is not None:
-            self.writer.write(frame)
+            self._write(self.head)
             if not detected:
                 self.post_left -= 1
                 if self.post_left <= 0:
-                    self.close()
+                    self._end_clip()
 
-        self.pre.append(frame)
+        self.head = (self.head + 1) % len(self.ring)
+        self.cached = min(self.cached + 1, self.pre_n)
 
 # ========== 1. 背景剪切 ==========
+# 各步骤输出的掩码缓冲区（按名字和帧尺寸分配一次，之后每帧复用；返回的掩码下一帧会被覆盖）
+_buffers = {}
+
+def _buffer(name, shape):
+    buf = _buffers.get(name)
+    if buf is None or buf.shape != shape:
+        buf = _buffers[name] = np.empty(shape, np.uint8)
+    return buf
+
+def contour_pixel_area(cnt):
+    """轮廓填充后的像素数（边界+内部），只在外接矩形内栅格化，不分配整帧"""
+    x, y, w, h = cv2.boundingRect(cnt)
+    tmp = np.zeros((h, w), np.uint8)
+    cv2.drawContours(tmp, [cnt], -1, 255, -1, offset=(-x, -y))
+    return cv2.countNonZero(tmp)
+
+@lru_cache(maxsize=None)
+def _disk(radius):
+    """cv2.circle 填充的半径为 radius 的圆及其像素数（按半径缓存）"""
+    tmp = np.zeros((2 * radius + 1, 2 * radius + 1), np.uint8)
+    cv2.circle(tmp, (radius, radius), radius, 255, -1)
+    return tmp, cv2.countNonZero(tmp)
+
+def disk_pixel_area(center, radius, shape):
+    """圆心为 center 的实心圆落在图像（shape）内的像素数，与在整帧上画圆计数一致"""
+    cx, cy = center
+    h, w = shape[:2]
+    disk, full_area = _disk(radius)
+    x0, y0 = cx - radius, cy - radius
+    x1, y1 = cx + radius + 1, cy + radius + 1
+    if x0 >= 0 and y0 >= 0 and x1 <= w and y1 <= h:
+        return full_area  # 整个圆都在图像内：直接用缓存的像素数
+    x0, y0, x1, y1 = max(x0, 0), max(y0, 0), min(x1, w), min(y1, h)
+    if x0 >= x1 or y0 >= y1:
+        return 0
+    return cv2.countNonZero(disk[y0 - cy + radius:y1 - cy + radius, x0 - cx + radius:x1 - cx + radius])
+
+def remove_small_regions(mask, min_area):
+    """去掉面积小于 min_area 的区域（噪声）"""
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    out = _buffer('small_regions', mask.shape)
+    out.fill(0)
+    # 面积=边界+内部像素；保留的轮廓最后一次性填充
+    kept = [cnt for cnt in contours if contour_pixel_area(cnt) >= min_area]
+    if kept:
+        cv2.drawContours(out, kept, -1, 255, -1)
+    return out
+
+def motion_gray(frame, scale=1, dst=None):
+    """帧差用的灰度图：scale>1 时先缩小（INTER_AREA 取均值）再转灰度"""
+    if scale > 1:
+        frame = cv2.resize(frame, None, fx=1 / scale, fy=1 / scale, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=dst)
+
 def detect_motion(prev_gray, curr_gray, diff_threshold, min_area=0):
     """两帧差分：abs(t - t-1)"""
-    diff = cv2.absdiff(curr_gray, prev_gray)
-    _, motion_mask = cv2.threshold(diff, diff_threshold, 255, cv2.THRESH_BINARY)
+    if isinstance(curr_gray, cv2.UMat):
+        diff = cv2.absdiff(curr_gray, prev_gray)
+        _, motion_mask = cv2.threshold(diff, diff_threshold, 255, cv2.THRESH_BINARY)
+        motion_mask = motion_mask.get()  # 轮廓和颜色筛选在 CPU 上做
+    else:
+        diff = cv2.absdiff(curr_gray, prev_gray, dst=_buffer('diff', curr_gray.shape))
+        _, motion_mask = cv2.threshold(diff, diff_threshold, 255, cv2.THRESH_BINARY,
+                                       dst=_buffer('motion', curr_gray.shape))
     if min_area > 0:
-        contours, _ = cv2.findContours(motion_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
-        out = np.zeros_like(motion_mask)
-        for cnt in contours:
-            tmp = np.zeros_like(motion_mask)
-            cv2.drawContours(tmp, [cnt], -1, 255, -1)  # 填充：面积=边界+内部像素
-            if cv2.countNonZero(tmp) >= min_area:
-                cv2.drawContours(out, [cnt], -1, 255, -1)
-        motion_mask = out
+        motion_mask = remove_small_regions(motion_mask, min_area)
     return motion_mask
 
 # ========== 2. 颜色筛选 ==========
 def filter_black_color(frame, mask, black_max):
-    """在运动区域中筛选黑/灰/白（通道接近）"""
+    """在运动区域中筛选黑/灰/白（通道接近）
+
+    返回的掩码是复用缓冲区，下一次调用时会被覆盖
+    """
+    shape = frame.shape[:2]
+    channels = [_buffer(f'ch{i}', shape) for i in range(3)]
+    mx, mn, gap = _buffer('max', shape), _buffer('min', shape), _buffer('gap', shape)
+    black_mask, color_filtered = _buffer('black', shape), _buffer('color', shape)
+
     # 只在运动区域内检测颜色
     # mask 内最亮与最暗的差值小于 RGB_GAP_MAX 的点为黑色/灰色/白色
-    b, g, r = cv2.split(frame)
+    b, g, r = cv2.split(frame, channels)
+    cv2.max(cv2.max(b, g, dst=mx), r, dst=mx)
+    cv2.min(cv2.min(b, g, dst=mn), r, dst=mn)
+    cv2.subtract(mx, mn, dst=gap)
 
-    max_rgb = np.maximum(np.maximum(r, g), b)
-    min_rgb = np.minimum(np.minimum(r, g), b)
-    gap = max_rgb - min_rgb
+    # 亮度上限（三通道都 <= black_max 即最大值 <= black_max）+ 通道差值限制（灰/白更符合：gap 小）
+    cv2.compare(gap, RGB_GAP_MAX, cv2.CMP_LE, dst=black_mask)
+    cv2.compare(mx, black_max, cv2.CMP_LE, dst=mn)
+    cv2.bitwise_and(black_mask, mn, dst=black_mask)
 
-    # 亮度上限 + 通道差值限制（灰/白更符合：gap 小）
-    black_mask = (
-        (r <= black_max) & (g <= black_max) & (b <= black_max) &
-        (gap <= RGB_GAP_MAX)
-    ).astype(np.uint8) * 255
-    
     # 与运动区域求交集
-    color_filtered = cv2.bitwise_and(black_mask, mask)
+    cv2.bitwise_and(black_mask, mask, dst=color_filtered)
     return color_filtered
 
+# ========== 1+2. 融合：背景剪切 + 颜色筛选 ==========
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _fused_masks(frame, prev_gray, curr_gray, diff_threshold, black_max, gap_max, gate, motion_out, color_out):
+        """逐像素一次遍历：帧差阈值 + 黑/灰色判断，同时写出运动掩码和颜色掩码
+        gate=True 时颜色掩码只保留运动像素；False 时输出整幅图的颜色掩码（由调用方再与运动掩码求交集）
+        """
+        h, w = curr_gray.shape
+        for y in prange(h):
+            for x in range(w):
+                d = abs(np.int16(curr_gray[y, x]) - np.int16(prev_gray[y, x]))
+                moving = d > diff_threshold
+                motion_out[y, x] = 255 if moving else 0
+                if gate and not moving:
+                    color_out[y, x] = 0
+                    continue
+                b = frame[y, x, 0]
+                g = frame[y, x, 1]
+                r = frame[y, x, 2]
+                mx = max(b, g, r)
+                mn = min(b, g, r)
+                color_out[y, x] = 255 if (mx <= black_max and mx - mn <= gap_max) else 0
+
+def detect_motion_color(frame, prev_gray, curr_gray, diff_threshold, black_max, min_area=0):
+    """帧差 + 颜色筛选（numba 融合内核），返回 (运动掩码, 颜色掩码)，结果与分步实现一致"""
+    motion_mask = _buffer('fused_motion', curr_gray.shape)
+    color_mask = _buffer('fused_color', curr_gray.shape)
+    # 去小区域会填充轮廓（区域内部的空洞也算运动），这时颜色掩码要和去噪后的运动掩码求交集
+    gate = min_area <= 0
+    _fused_masks(frame, prev_gray, curr_gray, diff_threshold, black_max, RGB_GAP_MAX, gate,
+                 motion_mask, color_mask)
+    if not gate:
+        motion_mask = remove_small_regions(motion_mask, min_area)
+        cv2.bitwise_and(color_mask, motion_mask, dst=color_mask)
+    return motion_mask, color_mask
+
 # ========== 3. 形状筛选 ==========
-def filter_by_shape(mask, min_area, max_area, min_circ):
-    """根据面积和圆形度筛选（圆形度越高越像蚊子）"""
-    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+def filter_by_shape(mask, min_area, max_area, min_circ, contours=None):
+    """根据面积和圆形度筛选（圆形度越高越像蚊子）
+
+    contours: 已经对 mask 求过的外轮廓（RETR_EXTERNAL），传入则不再重复查找
+    """
+    if contours is None:
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     
     valid_contours = []
-    shape_mask = np.zeros_like(mask)
+    shape_mask = _buffer('shape', mask.shape)
+    shape_mask.fill(0)
     mosquito_centers = []
+    if not contours:
+        return shape_mask, mosquito_centers, valid_contours
     
-    for cnt in contours:
-        # 面积：包含边界+内部像素（用填充后的像素计数）
-        tmp = np.zeros_like(mask)
-        cv2.drawContours(tmp, [cnt], -1, 255, -1)
-        area = cv2.countNonZero(tmp)
-        if area < min_area or area > max_area:
-            continue
+    # 连通域统计：一次扫描得到所有区域的面积（像素数）和质心
+    _, labels, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8, ltype=cv2.CV_32S)
+    # 外轮廓与 8 连通域一一对应，轮廓起点所在的连通域就是它的编号
+    starts = np.array([cnt[0, 0] for cnt in contours])
+    ids = labels[starts[:, 1], starts[:, 0]]
+    areas = stats[ids, cv2.CC_STAT_AREA]
+    
+    for k in np.flatnonzero((areas >= min_area) & (areas <= max_area)):
+        cnt = contours[k]
+        area = int(areas[k])
         
         # 检查圆形度（使用最小外接圆）
         (cx, cy), radius = cv2.minEnclosingCircle(cnt)
@@ -192,9 +444,7 @@ def filter_by_shape(mask, min_area, max_area, min_circ):
         
         # 计算圆形度 = 轮廓面积 / 外接圆面积
         # 外接圆面积：用像素计数（包含边界+内部像素），与 area 的定义一致
-        circle_mask = np.zeros_like(mask)
-        cv2.circle(circle_mask, (int(cx), int(cy)), int(radius), 255, -1)
-        circle_area = cv2.countNonZero(circle_mask)
+        circle_area = disk_pixel_area((int(cx), int(cy)), int(radius), mask.shape)
         circularity = area / circle_area if circle_area > 0 else 0
         
         # 只保留比较圆的形状（蚊子通常是圆形或椭圆形）
@@ -206,70 +456,85 @@ def filter_by_shape(mask, min_area, max_area, min_circ):
         
         # 通过筛选
         valid_contours.append(cnt)
-        cv2.drawContours(shape_mask, [cnt], -1, 255, -1)
-        
-        # 计算质心
-        M = cv2.moments(cnt)
-        if M["m00"] > 0:
-            cx = M["m10"] / M["m00"]
-            cy = M["m01"] / M["m00"]
-            mosquito_centers.append([cx, cy, area, w, h])
+        # 轮廓围成的面积为 0 的退化区域（单像素宽的线）只画进掩码，不算作蚊子
+        if cv2.contourArea(cnt) == 0:
+            continue
+        cx, cy = centroids[ids[k]]
+        mosquito_centers.append([float(cx), float(cy), area, w, h])
     
+    if valid_contours:
+        cv2.drawContours(shape_mask, valid_contours, -1, 255, -1)
     return shape_mask, mosquito_centers, valid_contours
 
 # ========== 4. 跟踪 ==========
+_last_tree = (None, None)  # (点集, KD 树)：当前帧的树下一帧作为上一帧的树复用
+
+def _kdtree(centers):
+    global _last_tree
+    if _last_tree[0] is not centers:
+        _last_tree = (centers, cKDTree(np.asarray(centers, dtype=np.float64)[:, :2]))
+    return _last_tree[1]
+
 def track_mosquitos(prev_centers, curr_centers, box_size):
     """
     以上一帧每个点为中心，在当前帧的 box_size×box_size 方形窗口内找点：
     - 有点：认为同一只蚊子
-    - 多个点：取最近的
+    - 多个点：取最近的（所有候选对按距离从近到远依次认领，每个点只匹配一次）
     """
     if not prev_centers or not curr_centers:
         return []
 
     half = int(box_size // 2)
+
+    prev_xy = np.asarray(prev_centers, dtype=np.float64)[:, :2]
+    curr_xy = np.asarray(curr_centers, dtype=np.float64)[:, :2]
+
+    # 方形窗口内的所有候选对（切比雪夫距离 <= half）
+    if cKDTree is not None:
+        prev_tree = _kdtree(prev_centers)
+        pairs = prev_tree.sparse_distance_matrix(_kdtree(curr_centers), half, p=np.inf, output_type='ndarray')
+        prev_ids, curr_ids = pairs['i'], pairs['j']
+    else:
+        # 没有 scipy：N×M 差值矩阵一次算完
+        dxy = np.abs(curr_xy[None, :, :] - prev_xy[:, None, :])
+        prev_ids, curr_ids = np.nonzero(dxy.max(axis=2) <= half)
+    if len(prev_ids) == 0:
+        return []
+
+    dists = np.hypot(*(curr_xy[curr_ids] - prev_xy[prev_ids]).T)
+
+    matched_prev = set()
     matched_curr = set()
     matches = []
+    for k in np.lexsort((curr_ids, prev_ids, dists)):
+        prev_idx, curr_idx = int(prev_ids[k]), int(curr_ids[k])
+        if prev_idx in matched_prev or curr_idx in matched_curr:
+            continue
+        # 最近的点太近：该点不匹配（当前点留给其他点）
+        matched_prev.add(prev_idx)
+        dist = float(dists[k])
+        if dist < MIN_MATCH_DISTANCE:
+            continue
+        matched_curr.add(curr_idx)
+        matches.append((curr_idx, prev_idx, dist))
 
-    for prev_idx, prev in enumerate(prev_centers):
-        px, py = float(prev[0]), float(prev[1])
-        best_i = -1
-        best_d2 = None
-
-        for curr_idx, curr in enumerate(curr_centers):
-            if curr_idx in matched_curr:
-                continue
-            cx, cy = float(curr[0]), float(curr[1])
-            dx = cx - px
-            dy = cy - py
-
-            # 只在以上一帧点为中心的矩形框内搜索
-            if abs(dx) > half or abs(dy) > half:
-                continue
-
-            d2 = dx * dx + dy * dy
-            if best_d2 is None or d2 < best_d2:
-                best_d2 = d2
-                best_i = curr_idx
-
-        if best_i >= 0:
-            dist = math.sqrt(best_d2) if best_d2 is not None else 0.0
-            if dist < MIN_MATCH_DISTANCE:
-                continue
-            matched_curr.add(best_i)
-            matches.append((best_i, prev_idx, dist))
-
+    matches.sort(key=lambda m: m[1])
     return matches
 
 # ========== 主程序 ==========
 def main():
     # 摄像头输入（默认 0，可传入编号：python follow_moving_mosquitos.py 1）
     cam = int(sys.argv[1]) if len(sys.argv) > 1 else CAM_ID_DEFAULT
-    cap = cv2.VideoCapture(cam)
+    cap = cv2.VideoCapture(cam, cv2.CAP_V4L2)
+    if not cap.isOpened():
+        cap = cv2.VideoCapture(cam)  # 非 Linux / 没有 V4L2 时用默认后端
     if not cap.isOpened():
         print(f"错误: 无法打开摄像头: {cam}")
         sys.exit(1)
 
+    # FOURCC 要在分辨率之前设置，否则部分驱动会按原格式协商分辨率
+    if CAM_FOURCC:
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*CAM_FOURCC))
     if CAM_WIDTH > 0:
         cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAM_WIDTH)
     if CAM_HEIGHT > 0:
@@ -294,50 +559,118 @@ def main():
     height, width = frame.shape[:2]
     print(f"摄像头: {cam} | {width}x{height} @ {fps:.1f}fps\n")
 
-    # 初始化两帧差分缓存
-    prev_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    # 显示画布（2x3布局）只分配一次，6个子图都是画布上的视图，直接在上面绘制
+    combined = np.empty((2 * height, 3 * width, 3), np.uint8)
+    im_original = combined[:height, :width]
+    im_motion = combined[:height, width:2 * width]
+    im_color = combined[:height, 2 * width:]
+    im_contour = combined[height:, :width]
+    im_mosquito = combined[height:, width:2 * width]
+    im_tracking = combined[height:, 2 * width:]
+    # 子图标签不变：启动时画到 label_layer（文字颜色）和 label_mask（文字像素）上，
+    # 每帧只拷贝两行子图顶部含文字的横条。putText 会抗锯齿，mask 二值化成 0/255、
+    # 文字层用纯色填充，拷贝后文字边缘不会出现暗边
+    label_layer = np.zeros_like(combined)
+    label_mask = np.zeros(combined.shape[:2], np.uint8)
+    for text, org in [
+        ('1.original', (10, 30)),
+        ('2.motion_filtered', (width + 10, 30)),
+        ('3.color_filtered', (width * 2 + 10, 30)),
+        ('4.all_contours', (10, height + 30)),
+        ('5.shape_filtered', (width + 10, height + 30)),
+        ('6.tracking', (width * 2 + 10, height + 30)),
+    ]:
+        cv2.putText(label_mask, text, org, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 255, 2, cv2.LINE_8)
+    cv2.threshold(label_mask, 127, 255, cv2.THRESH_BINARY, dst=label_mask)
+    label_layer[label_mask > 0] = (0, 255, 0)
+    label_rows = np.flatnonzero(label_mask.any(axis=1))
+    label_strips = []
+    for top in (0, height):
+        rows = label_rows[(label_rows >= top) & (label_rows < top + height)]
+        if len(rows):
+            label_strips.append((rows[0], rows[-1] + 1))
+
+    # 其余每帧用到的整帧缓冲区也只分配一次
+    tracked_frame = np.empty_like(frame)
+
+    # 初始化两帧差分缓存（两块灰度缓冲区轮换：当前帧写入上上帧用过的那块）
+    # 融合内核逐像素对应原图，缩小帧差时走分步实现；OpenCL 只用于分步实现
+    use_fused = USE_NUMBA and njit is not None and MOTION_DOWNSCALE <= 1
+    use_opencl = USE_OPENCL and not use_fused and cv2.ocl.haveOpenCL()
+    cv2.ocl.setUseOpenCL(use_opencl)
+    prev_gray = motion_gray(frame, MOTION_DOWNSCALE)
+    spare_gray = np.empty_like(prev_gray)
+    if use_opencl:
+        prev_gray, spare_gray = cv2.UMat(prev_gray), cv2.UMat(spare_gray)
     prev_centers = []
     mosquito_id = 0
 
     base_name = f"cam{cam}"
-    clip_saver = ClipSaver(CLIP_DIR, CLIP_PRE_FRAMES, CLIP_POST_FRAMES) if SAVE_CLIPS else None
+    clip_saver = ClipSaver(CLIP_DIR, CLIP_PRE_FRAMES, CLIP_POST_FRAMES, CLIP_WRITE_QUEUE) if SAVE_CLIPS else None
     clip_saver_combined = (
-        ClipSaver(CLIP_DIR, CLIP_PRE_FRAMES, CLIP_POST_FRAMES) if (SAVE_CLIPS and SAVE_COMBINED_CLIPS) else None
+        ClipSaver(CLIP_DIR, CLIP_PRE_FRAMES, CLIP_POST_FRAMES, CLIP_WRITE_QUEUE)
+        if (SAVE_CLIPS and SAVE_COMBINED_CLIPS) else None
     )
     
+    print(f"帧差+颜色筛选: {'numba 融合内核' if use_fused else 'OpenCV/NumPy 分步'}"
+          f"{'（灰度+帧差用 OpenCL）' if use_opencl else ''}")
+    if MOTION_DOWNSCALE > 1:
+        print(f"帧差分辨率: 1/{MOTION_DOWNSCALE}")
+    # 缩小后一个像素对应 N×N 个原图像素，最小变化面积按比例换算
+    motion_min_area = math.ceil(MIN_CHANGE_AREA / (MOTION_DOWNSCALE * MOTION_DOWNSCALE))
+
     frame_idx = 0
     paused = False
     delay = int(1000 / fps) if fps > 0 else 30
+    grabber = FrameGrabber(cap) if THREADED_CAPTURE else None
+    # 2x3 拼图只给窗口和 combined 片段用，两者都关掉时不拼
+    compose = SHOW_UI or clip_saver_combined is not None
+    if grabber is not None:
+        delay = 1  # 取帧本身会等到新帧，不用再按帧率等待
     
     try:
         while True:
             if not paused:
-                ret, frame = cap.read()
+                ret, frame = grabber.read() if grabber is not None else cap.read()
                 if not ret:
                     print("读取摄像头失败，退出")
                     break
 
                 frame_idx += 1
-                curr_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-                # === 1. 背景剪切 ===
-                motion_mask = detect_motion(prev_gray, curr_gray, DIFF_THRESHOLD, MIN_CHANGE_AREA)
-
-                # === 2. 颜色筛选 ===
-                color_mask = filter_black_color(frame, motion_mask, BLACK_MAX)
+                curr_gray = motion_gray(cv2.UMat(frame) if use_opencl else frame, MOTION_DOWNSCALE, dst=spare_gray)
 
-                # 颜色筛选后所有轮廓（用于 pd）
-                all_contours, _ = cv2.findContours(color_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
-
-                # === 3. 形状筛选 ===
-                shape_mask, curr_centers, contours = filter_by_shape(
-                    color_mask, MIN_AREA, MAX_AREA, MIN_CIRCULARITY
-                )
+                if use_fused:
+                    # === 1+2. 背景剪切 + 颜色筛选（融合内核）===
+                    motion_mask, color_mask = detect_motion_color(
+                        frame, prev_gray, curr_gray, DIFF_THRESHOLD, BLACK_MAX, MIN_CHANGE_AREA
+                    )
+                    has_motion = cv2.countNonZero(motion_mask) > 0
+                else:
+                    # === 1. 背景剪切 ===
+                    motion_mask = detect_motion(prev_gray, curr_gray, DIFF_THRESHOLD, motion_min_area)
+                    if MOTION_DOWNSCALE > 1:
+                        motion_mask = cv2.resize(motion_mask, (width, height), interpolation=cv2.INTER_NEAREST)
+                    has_motion = cv2.countNonZero(motion_mask) > 0
+
+                    # === 2. 颜色筛选 ===（没有运动像素时颜色掩码也是全 0）
+                    color_mask = filter_black_color(frame, motion_mask, BLACK_MAX) if has_motion else motion_mask
+
+                if has_motion:
+                    # 颜色筛选后所有轮廓（用于 pd）
+                    all_contours, _ = cv2.findContours(color_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+                    # === 3. 形状筛选 ===
+                    shape_mask, curr_centers, contours = filter_by_shape(
+                        color_mask, MIN_AREA, MAX_AREA, MIN_CIRCULARITY, all_contours
+                    )
+                else:
+                    # 画面静止：跳过轮廓和形状筛选
+                    all_contours, contours, curr_centers = (), (), []
 
                 # === 4. 跟踪 ===
                 matches = track_mosquitos(prev_centers, curr_centers, MATCH_BOX_SIZE)
 
-                tracked_frame = frame.copy()
+                np.copyto(tracked_frame, frame)
 
                 # 绘制跟踪结果
                 for i, center_info in enumerate(curr_centers):
@@ -368,48 +701,44 @@ def main():
                     print(f"[帧{frame_idx}] 检测到 {len(curr_centers)} 只蚊子 | 跟踪={tracked_count} 新={new_count}")
 
                 # 更新两帧差分缓存 + 跟踪数据
-                prev_gray = curr_gray
+                prev_gray, spare_gray = curr_gray, prev_gray
                 prev_centers = curr_centers
 
                 # === 显示结果（pa~pf）===
-                white_bg = np.ones_like(frame) * 255
-
-                # 1) pa 原始图
-                im_original = frame.copy()
-
-                # 2) pb 运动图（白底+彩色运动区域）
-                im_motion = white_bg.copy()
-                im_motion[motion_mask > 0] = frame[motion_mask > 0]
-
-                # 3) pc pb过滤颜色后的彩图（白底+彩色）
-                im_color = white_bg.copy()
-                im_color[color_mask > 0] = frame[color_mask > 0]
-
-                # 4) pd 在 pc 上画所有轮廓
-                im_contour = im_color.copy()
-                cv2.drawContours(im_contour, all_contours, -1, (255, 0, 0), 1)  # 黄：所有轮廓
-
-                # 5) pe 在 pc 上画筛选后的轮廓
-                im_mosquito = im_color.copy()
-                cv2.drawContours(im_mosquito, contours, -1, (0, 255, 0), 1)  # 绿：筛选后轮廓
-
-                # 6) pf 筛选出蚊子（在 pa 上圈出中心）
-                im_tracking = im_original.copy()
-                for center_info in curr_centers:
-                    cx, cy, area, w, h = center_info
-                    x, y = int(cx), int(cy)
-                    cv2.circle(im_tracking, (x, y), 15, (0, 0, 255), 2)
-                    cv2.circle(im_tracking, (x, y), 3, (255, 0, 0), -1)
-
-                # 拼接显示（2x3布局）
-                row1 = np.hstack([im_original, im_motion, im_color])
-                row2 = np.hstack([im_contour, im_mosquito, im_tracking])
-                combined = np.vstack([row1, row2])
+                if compose:
+                    # 1) pa 原始图
+                    np.copyto(im_original, frame)
+
+                    # 2) pb 运动图（白底+彩色运动区域）
+                    im_motion.fill(255)
+                    if has_motion:
+                        cv2.copyTo(frame, motion_mask, im_motion)
+
+                    # 3) pc pb过滤颜色后的彩图（白底+彩色）
+                    im_color.fill(255)
+                    if has_motion:
+                        cv2.copyTo(frame, color_mask, im_color)
+
+                    # 4) pd 在 pc 上画所有轮廓
+                    np.copyto(im_contour, im_color)
+                    cv2.drawContours(im_contour, all_contours, -1, (255, 0, 0), 1)  # 黄：所有轮廓
+
+                    # 5) pe 在 pc 上画筛选后的轮廓
+                    np.copyto(im_mosquito, im_color)
+                    cv2.drawContours(im_mosquito, contours, -1, (0, 255, 0), 1)  # 绿：筛选后轮廓
+
+                    # 6) pf 筛选出蚊子（在 pa 上圈出中心）
+                    np.copyto(im_tracking, im_original)
+                    for center_info in curr_centers:
+                        cx, cy, area, w, h = center_info
+                        x, y = int(cx), int(cy)
+                        cv2.circle(im_tracking, (x, y), 15, (0, 0, 255), 2)
+                        cv2.circle(im_tracking, (x, y), 3, (255, 0, 0), -1)
 
                 # === 保存片段：原始帧(带框) + combined（同样前/后帧数）===
                 detected = len(curr_centers) > 0
                 if clip_saver is not None:
-                    save_frame = frame.copy()
+                    boxes = []
                     for cx, cy, area, ww, hh in curr_centers:
                         x, y = int(cx), int(cy)
                         bw = max(10, int(ww))
@@ -418,30 +747,21 @@ def main():
                         y1 = max(0, y - bh // 2)
                         x2 = min(width - 1, x + bw // 2)
                         y2 = min(height - 1, y + bh // 2)
-                        cv2.rectangle(save_frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
-                    clip_saver.push(save_frame, detected, fps or 30.0, width, height, base_name, frame_idx)
+                        boxes.append((x1, y1, x2, y2))
+                    clip_saver.push(frame, detected, fps or 30.0, width, height, base_name, frame_idx, boxes)
                 if clip_saver_combined is not None:
                     ch, cw = combined.shape[:2]
                     clip_saver_combined.push(
                         combined, detected, fps or 30.0, cw, ch, f"{base_name}_combined", frame_idx
                     )
 
-                # 添加标签
-                cv2.putText(combined, '1.original', (10, 30),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                cv2.putText(combined, '2.motion_filtered', (width + 10, 30),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                cv2.putText(combined, '3.color_filtered', (width * 2 + 10, 30),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                cv2.putText(combined, '4.all_contours', (10, height + 30),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                cv2.putText(combined, '5.shape_filtered', (width + 10, height + 30),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                cv2.putText(combined, '6.tracking', (width * 2 + 10, height + 30),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-
-                if SHOW_UI:
-                    cv2.imshow('Mosquito Tracking', combined)
+                if compose:
+                    # 添加标签（文字预先画好，只把文字像素拷回画布）
+                    for r0, r1 in label_strips:
+                        cv2.copyTo(label_layer[r0:r1], label_mask[r0:r1], combined[r0:r1])
+
+                    if SHOW_UI:
+                        cv2.imshow('Mosquito Tracking', combined)
 
             # 处理按键
             if SHOW_UI:
@@ -457,6 +777,8 @@ def main():
     except KeyboardInterrupt:
         print("\n收到 Ctrl+C，退出")
     
+    if grabber is not None:
+        grabber.stop()
     cap.release()
     if clip_saver is not None:
         clip_saver.close()
@@ -6,6 +6,11 @@ import numpy as np
 import sys
 import os
 
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # 没有 scipy 时用距离矩阵
+    cKDTree = None
+
 # ========== 配置参数 ==========
 # 颜色检测模式
 COLOR_MODE = 'custom'  # 'red', 'green', 'blue', 'custom'
@@ -25,26 +30,21 @@ MAX_MATCH_DISTANCE = 20     # 帧间最大匹配距离（像素）
 # ========== 颜色检测函数 ==========
 def detect_color_points(frame, mode, config):
     """检测指定颜色的点，返回质心坐标列表"""
-    b, g, r = cv2.split(frame)
-    
     if mode == 'custom':
-        # 自定义模式：RGB范围
+        # 自定义模式：RGB范围（inRange 一次遍历，上下限都包含）
         r_min, r_max = config['r']
         g_min, g_max = config['g']
         b_min, b_max = config['b']
-        mask = ((r >= r_min) & (r <= r_max) &
-                (g >= g_min) & (g <= g_max) &
-                (b >= b_min) & (b <= b_max)).astype(np.uint8) * 255
+        mask = cv2.inRange(frame, (b_min, g_min, r_min), (b_max, g_max, r_max))
     else:
         # 预设模式：目标通道比其他通道高
-        channels = [b, g, r]
-        target = channels[config['ch']].astype(np.int16)
-        others = [channels[i].astype(np.int16) for i in range(3) if i != config['ch']]
+        channels = cv2.split(frame)
+        target = channels[config['ch']]
+        o1, o2 = (channels[i] for i in range(3) if i != config['ch'])
         
-        mask = (channels[config['ch']] > config['min'])
-        for other in others:
-            mask &= (target - other > config['gap'])
-        mask = mask.astype(np.uint8) * 255
+        # 目标通道比另外两个通道都高 gap 以上：target > max(others) + gap（饱和加法，不会溢出）
+        mask = cv2.compare(target, cv2.add(cv2.max(o1, o2), config['gap']), cv2.CMP_GT)
+        cv2.bitwise_and(mask, cv2.compare(target, config['min'], cv2.CMP_GT), dst=mask)
     
     # 找轮廓并计算质心
     contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -58,30 +58,41 @@ def detect_color_points(frame, mode, config):
     return np.array(points, dtype=np.float32) if points else None, mask
 
 # ========== 点匹配函数 ==========
+_last_tree = (None, None)  # (点集, KD 树)：当前帧的树下一帧作为上一帧的树复用（先查上一帧才能命中）
+
+def _kdtree(pts):
+    global _last_tree
+    if _last_tree[0] is not pts:
+        _last_tree = (pts, cKDTree(pts))
+    return _last_tree[1]
+
 def match_points(prev_pts, curr_pts, max_dist):
-    """最近邻匹配，返回匹配结果：[(curr_idx, prev_idx, distance), ...]"""
+    """最近邻匹配（候选对按距离从近到远依次认领），返回匹配结果：[(curr_idx, prev_idx, distance), ...]"""
     if prev_pts is None or curr_pts is None:
         return []
     
+    # max_dist 内的所有候选对
+    if cKDTree is not None:
+        prev_tree = _kdtree(prev_pts)
+        pairs = prev_tree.sparse_distance_matrix(_kdtree(curr_pts), max_dist, output_type='ndarray')
+        prev_ids, curr_ids, dists = pairs['i'], pairs['j'], pairs['v']
+    else:
+        d = np.linalg.norm(curr_pts[:, None, :] - prev_pts[None, :, :], axis=2)
+        curr_ids, prev_ids = np.nonzero(d <= max_dist)
+        dists = d[curr_ids, prev_ids]
+    
     matches = []
+    matched_curr = set()
     matched_prev = set()
+    for k in np.lexsort((prev_ids, curr_ids, dists)):
+        i, j = int(curr_ids[k]), int(prev_ids[k])
+        if i in matched_curr or j in matched_prev:
+            continue
+        matches.append((i, j, float(dists[k])))
+        matched_curr.add(i)
+        matched_prev.add(j)
     
-    for i, curr in enumerate(curr_pts):
-        min_dist = float('inf')
-        best_match = -1
-        
-        for j, prev in enumerate(prev_pts):
-            if j in matched_prev:
-                continue
-            dist = np.linalg.norm(curr - prev)
-            if dist < min_dist:
-                min_dist = dist
-                best_match = j
-        
-        if best_match >= 0 and min_dist <= max_dist:
-            matches.append((i, best_match, min_dist))
-            matched_prev.add(best_match)
-    
+    matches.sort()
     return matches
 
 # ========== 主程序 ==========
@@ -118,15 +129,16 @@ def main():
     config = COLOR_PRESETS[COLOR_MODE]
     prev_points = None
     trail_mask = np.zeros_like(frame)
+    white_bg = np.empty_like(frame)  # 显示画布只分配一次，每帧重新填白
     frame_idx = 0
     paused = False
     
     # 重置函数
     def reset_video():
-        nonlocal prev_points, trail_mask, frame_idx
+        nonlocal prev_points, frame_idx
         cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
         prev_points = None
-        trail_mask = np.zeros_like(frame)
+        trail_mask.fill(0)
         frame_idx = 0
         print("重播...\n")
     
@@ -148,7 +160,7 @@ def main():
             curr_points, color_mask = detect_color_points(frame, COLOR_MODE, config)
             
             # 创建显示图像
-            white_bg = np.ones_like(frame) * 255
+            white_bg.fill(255)
             
             if curr_points is None:
                 print(f"[帧{frame_idx}] 未检测到点")
@@ -33,7 +33,11 @@ def main() -> int:
 
     target_path, temp_path = _make_target_and_temp(target)
 
-    cap = cv2.VideoCapture(0)
+    cap = cv2.VideoCapture(0, cv2.CAP_V4L2)
+    if not cap.isOpened():
+        cap = cv2.VideoCapture(0)  # 非 Linux / 没有 V4L2 时用默认后端
+    # MJPG 传输：USB 带宽比 YUYV 小很多，640x480 也能跑满帧率（要在分辨率之前设置）
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
     cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
     cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
 
@@ -2,6 +2,7 @@
 """检测两帧间变化的像素点"""
 
 import cv2
+import numpy as np
 import sys
 
 # 参数
@@ -10,6 +11,7 @@ file_name = "moving_red_point.mp4"
 
 video_file = sys.argv[1] if len(sys.argv) > 1 else file_name
 diff_threshold = 5  # 像素变化阈值（可按 +/- 调整）
+PRINT_EVERY = 30    # 每 N 帧打印一次这段时间内的最大变化像素数（逐帧打印会拖慢播放）
 
 print(f"阈值: {diff_threshold} | 按 'q' 退出 | 按 '空格' 暂停 | 按 'r' 重播 | 按 '+/-' 调整阈值\n")
 
@@ -22,7 +24,13 @@ while True:
         print("无法读取视频")
         sys.exit(1)
     
+    # 灰度/帧差/二值图缓冲区只分配一次，两块灰度缓冲区轮换
     prev_gray = cv2.cvtColor(prev_frame, cv2.COLOR_BGR2GRAY)
+    curr_gray = np.empty_like(prev_gray)
+    diff = np.empty_like(prev_gray)
+    changed_pixels = np.empty_like(prev_gray)
+    frame_idx = 0
+    max_count = 0
     paused = False
     replay = False
     
@@ -35,23 +43,27 @@ while True:
                 print("视频结束，按 'r' 重播 | 按 'q' 退出")
                 video_ended = True
             else:
-                curr_gray = cv2.cvtColor(curr_frame, cv2.COLOR_BGR2GRAY)
+                cv2.cvtColor(curr_frame, cv2.COLOR_BGR2GRAY, dst=curr_gray)
                 
                 # 计算帧差并二值化
-                diff = cv2.absdiff(prev_gray, curr_gray)
-                _, changed_pixels = cv2.threshold(diff, diff_threshold, 255, cv2.THRESH_BINARY)
+                cv2.absdiff(prev_gray, curr_gray, dst=diff)
+                cv2.threshold(diff, diff_threshold, 255, cv2.THRESH_BINARY, dst=changed_pixels)
                 
-                # 统计变化像素数
+                # 统计变化像素数（每 PRINT_EVERY 帧打印一次区间最大值）
                 pixel_count = cv2.countNonZero(changed_pixels)
-                if pixel_count > 0:
-                    print(f"变化像素: {pixel_count}")
+                max_count = max(max_count, pixel_count)
+                frame_idx += 1
+                if frame_idx % PRINT_EVERY == 0:
+                    if max_count > 0:
+                        print(f"变化像素: 最近 {PRINT_EVERY} 帧最大 {max_count}")
+                    max_count = 0
                 
                 # 显示
                 cv2.imshow('Original', curr_frame)
                 cv2.imshow('Changed Pixels', changed_pixels)
                 
-                # 更新上一帧
-                prev_gray = curr_gray
+                # 更新上一帧（交换缓冲区，不重新转换）
+                prev_gray, curr_gray = curr_gray, prev_gray
         
         # 处理按键
         key = cv2.waitKey(30 if not paused else 100) & 0xFF
@@ -3,21 +3,317 @@
 
 import cv2
 import numpy as np
+import queue
 import sys
+import threading
 import time
 
+try:
+    from numba import njit, prange
+except ImportError:  # 没有 numba 时逐点 cv2.circle
+    njit = None
+
 video_file = "moving_red_point.mp4"
 # video_file = "video_static.mp4"
 
 # 参数
 video_file = sys.argv[1] if len(sys.argv) > 1 else video_file
 max_features = 100     # ORB最大特征点数量
+lowe_ratio = 0.8       # LSH 近邻的比值检验阈值
+static_max_diff = 4    # 缩略图逐像素灰度差都不超过这个值时认为画面静止，跳过检测沿用上次的特征点（0 关闭）
+thumb_size = (80, 60)  # 静止判断用的缩略图尺寸
+bf_max_pairs = 500 * 500  # 两帧描述子对数不超过这个时用 popcount 精确暴力匹配，更多时用 LSH
+point_radius = 5       # 特征点圆点半径
+max_labels = 200       # 最多标注的ID数量，特征点更多时隔几个标一个
+queue_size = 2         # 解码 -> ORB -> 显示 各级之间的队列长度
+use_opencl = True      # 没有 CUDA 时，灰度转换+ORB 检测用 OpenCL（T-API，UMat），需要 OpenCV 支持 OpenCL
+
+# 二进制描述子用 FLANN 的多探针 LSH（algorithm=6 即 FLANN_INDEX_LSH）
+LSH_INDEX_PARAMS = dict(algorithm=6, table_number=6, key_size=12, multi_probe_level=1)
+LSH_SEARCH_PARAMS = dict(checks=50)
+
+# 在途帧数上限：两个队列各 queue_size 帧，加上解码、ORB、显示各占一帧，再留一帧余量
+FRAME_RING = 2 * queue_size + 4
+
+# 有 CUDA 版 OpenCV 且有 GPU 时，ORB 检测和描述子匹配都在 GPU 上做
+use_cuda = hasattr(cv2, 'cuda') and cv2.cuda.getCudaEnabledDeviceCount() > 0
+# NumPy 2.0+ 的 bitwise_count 用 CPU 的 popcnt 指令，汉明距离矩阵比 BFMatcher 快；老版本 NumPy 只用 LSH
+use_popcount = hasattr(np, 'bitwise_count')
+use_opencl = use_opencl and not use_cuda and cv2.ocl.haveOpenCL()
+cv2.ocl.setUseOpenCL(use_opencl)
 
-print(f"ORB特征点参数: 最大数量={max_features}")
+print(f"ORB特征点参数: 最大数量={max_features} | {'CUDA' if use_cuda else 'OpenCL' if use_opencl else 'CPU'}")
 print("按 'q' 退出 | 按 '空格' 暂停 | 按 'r' 重播 | 按 '+/-' 调整数量\n")
 
-# 创建ORB检测器
-orb = cv2.ORB_create(nfeatures=max_features)
+# ORB 每次调用在内部重建金字塔，无法跨帧复用。手工 resize 金字塔 + 逐层 FAST + orb.compute 实测更慢
+# （640×480：3.6ms vs detectAndCompute 2.6ms），且 compute 不会给传入的关键点算方向（angle 保持 -1，
+# 失去 steered BRIEF 的旋转不变性），所以保留 detectAndCompute
+def create_orb(nfeatures):
+    if use_cuda:
+        return cv2.cuda_ORB.create(nfeatures=nfeatures)
+    return cv2.ORB_create(nfeatures=nfeatures)
+
+def cross_check_match(matcher, query, train):
+    """双向匹配只保留互为最近的（GPU 匹配器没有 crossCheck 参数）"""
+    back = {m.queryIdx: m.trainIdx for m in matcher.match(train, query)}
+    return [m for m in matcher.match(query, train) if back.get(m.trainIdx) == m.queryIdx]
+
+def match_indices(matches):
+    """DMatch 列表 -> (上一帧索引, 本帧索引) 数组"""
+    prev_idx = np.fromiter((m.queryIdx for m in matches), np.int64, len(matches))
+    curr_idx = np.fromiter((m.trainIdx for m in matches), np.int64, len(matches))
+    return prev_idx, curr_idx
+
+def hamming_matrix(a, b):
+    """两组 32 字节 ORB 描述子的汉明距离矩阵：按 64 位字 XOR + popcount 累加，不生成 N×M×32 的中间数组"""
+    a64 = a.view(np.uint64)
+    b64 = b.view(np.uint64)
+    dist = np.zeros((len(a), len(b)), np.uint16)
+    word = np.empty(dist.shape, np.uint64)
+    bits = np.empty(dist.shape, np.uint8)
+    for k in range(a64.shape[1]):
+        np.bitwise_xor(a64[:, k, None], b64[None, :, k], out=word)
+        np.bitwise_count(word, out=bits)
+        dist += bits
+    return dist
+
+def popcount_cross_match(prev_descriptors, descriptors):
+    """精确暴力匹配，只保留互为最近的（与 BFMatcher crossCheck=True 相同）"""
+    dist = hamming_matrix(prev_descriptors, descriptors)
+    forward = dist.argmin(axis=1)
+    backward = dist.argmin(axis=0)
+    prev_idx = np.nonzero(backward[forward] == np.arange(len(forward)))[0]
+    return prev_idx, forward[prev_idx]
+
+def build_lsh(descriptors):
+    """在描述子上建 LSH 索引，本帧建的下一帧反向查询时直接复用"""
+    index = cv2.FlannBasedMatcher(LSH_INDEX_PARAMS, LSH_SEARCH_PARAMS)
+    index.add([descriptors])
+    index.train()
+    return index
+
+def ratio_best(knn_matches):
+    """Lowe 比值检验，返回 {queryIdx: 最近邻 DMatch}"""
+    best = {}
+    for pair in knn_matches:
+        if len(pair) == 1 or (len(pair) == 2 and pair[0].distance < lowe_ratio * pair[1].distance):
+            best[pair[0].queryIdx] = pair[0]
+    return best
+
+def lsh_cross_match(prev_index, curr_index, prev_descriptors, descriptors):
+    """prev->curr 与 curr->prev 双向 LSH 近邻取交集（等价于 crossCheck）"""
+    # 索引里只有一个描述子时 knnMatch 只能取 k=1
+    forward = ratio_best(curr_index.knnMatch(prev_descriptors, k=min(2, len(descriptors))))
+    backward = ratio_best(prev_index.knnMatch(descriptors, k=min(2, len(prev_descriptors))))
+    return [m for q, m in forward.items()
+            if m.trainIdx in backward and backward[m.trainIdx].trainIdx == q]
+
+def disk_offsets(radius):
+    """用 cv2.circle 画一次实心圆，取像素偏移，逐点盖章和 cv2.circle 结果一致"""
+    size = 2 * radius + 1
+    canvas = np.zeros((size, size), np.uint8)
+    cv2.circle(canvas, (radius, radius), radius, 255, -1)
+    dys, dxs = np.nonzero(canvas)
+    return (dys - radius).astype(np.int32), (dxs - radius).astype(np.int32)
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _splat_disks(img, xs, ys, dys, dxs, color):
+        """所有特征点的实心圆一次画完（越界部分裁掉）"""
+        h, w = img.shape[:2]
+        for i in prange(len(xs)):
+            for j in range(len(dys)):
+                y = ys[i] + dys[j]
+                x = xs[i] + dxs[j]
+                if 0 <= y < h and 0 <= x < w:
+                    for c in range(3):
+                        img[y, x, c] = color[c]
+
+def draw_disks(img, pts, radius, color):
+    if njit is None:
+        for x, y in pts:
+            cv2.circle(img, (int(x), int(y)), radius, color, -1)
+        return
+    dys, dxs = disk_offsets(radius)
+    _splat_disks(img, pts[:, 0], pts[:, 1], dys, dxs, np.array(color, np.uint8))
+
+if use_cuda:
+    stream = cv2.cuda_Stream()
+    gpu_gray = cv2.cuda_GpuMat()  # 每帧上传灰度图到同一块显存，不重新分配
+
+def put_until(q, item, stop):
+    """队列满时等待（不丢帧：逐帧匹配要求帧连续），stop 置位后放弃"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+def get_until(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return None
+
+def capture_loop(cap, first_frame, out_q, stop):
+    """解码线程：每帧解码到环形缓冲里的一块送给 ORB 线程，视频结束时送 None"""
+    ring = [first_frame] + [None] * (FRAME_RING - 1)
+    i = 0
+    while True:
+        ret, ring[i] = cap.read(ring[i])
+        if not ret:
+            put_until(out_q, None, stop)
+            return
+        if not put_until(out_q, ring[i], stop):
+            return
+        i = (i + 1) % FRAME_RING
+
+def orb_loop(in_q, out_q, stop):
+    """ORB 线程：检测 + 匹配 + 维护ID，把 (帧, 序号, 坐标, ID, 耗时) 送给显示线程，结束时送 None"""
+    n_features = max_features
+    orb = create_orb(n_features)
+    frame_idx = 0
+    
+    # 初始化跟踪数据
+    prev_keypoints = None
+    prev_descriptors = None
+    point_ids = np.empty(0, np.int64)  # keypoint索引 -> ID的映射
+    next_id = 0            # 下一个可用的ID
+    gray = None            # 灰度缓冲，逐帧复用（OpenCL 时是 UMat，留在显存里）
+    ref_thumb = None       # 上次完整检测时的缩略图（和它比，慢慢变化也不会一直被跳过）
+    last_pts = None        # 上次检测到的特征点坐标
+    
+    # 特征匹配：GPU 上用暴力匹配（描述子留在显存里跨帧），CPU 上用 popcount 暴力匹配或 LSH 索引
+    if use_cuda:
+        bf = cv2.cuda.DescriptorMatcher_createBFMatcher(cv2.NORM_HAMMING)
+    prev_index = None      # 上一帧描述子的 LSH 索引（只在走 LSH 时才建）
+    
+    while True:
+        frame = get_until(in_q, stop)
+        if frame is None:
+            put_until(out_q, None, stop)
+            return
+        if n_features != max_features:  # 主线程按了 '+/-'
+            n_features = max_features
+            orb = create_orb(n_features)
+            ref_thumb = None
+        
+        frame_idx += 1
+        gray = cv2.cvtColor(cv2.UMat(frame) if use_opencl else frame, cv2.COLOR_BGR2GRAY, dst=gray)
+        
+        # 画面相对上次检测几乎没变时跳过 ORB 检测和匹配，沿用上次的特征点和ID
+        if static_max_diff > 0:
+            thumb = cv2.resize(gray, thumb_size, interpolation=cv2.INTER_AREA)
+            if ref_thumb is not None and cv2.minMaxLoc(cv2.absdiff(thumb, ref_thumb))[1] <= static_max_diff:
+                print(f"[帧 {frame_idx}] 画面静止，沿用上次的 {0 if last_pts is None else len(last_pts)} 个特征点")
+                if not put_until(out_q, (frame, frame_idx, last_pts, point_ids, 0.0), stop):
+                    return
+                continue
+            ref_thumb = thumb
+        
+        # ORB检测特征点
+        start_time = time.time()
+        if use_cuda:
+            gpu_gray.upload(gray, stream)
+            kp_gpu, descriptors = orb.detectAndComputeAsync(gpu_gray, None, stream=stream)
+            stream.waitForCompletion()
+            keypoints = orb.convert(kp_gpu)  # 只把关键点坐标下载下来画图
+            if not keypoints:
+                descriptors = None
+        else:
+            keypoints, descriptors = orb.detectAndCompute(gray, None)
+            if isinstance(descriptors, cv2.UMat):  # 匹配在主机内存上做，描述子只有 N×32 字节
+                descriptors = descriptors.get() if keypoints else None
+            curr_index = None
+        detect_time = (time.time() - start_time) * 1000  # 转换为毫秒
+        
+        if not keypoints:
+            print(f"[帧 {frame_idx}] 未检测到特征点")
+            last_pts = None
+            put_until(out_q, (frame, frame_idx, None, point_ids, detect_time), stop)
+            continue
+        
+        pts = cv2.KeyPoint_convert(keypoints).astype(np.int32)  # 坐标一次转成 N×2 数组
+        last_pts = pts
+        print(f"[帧 {frame_idx}] 检测到 {len(keypoints)} 个ORB特征点 | 耗时: {detect_time:.2f}ms")
+        
+        # 第一帧：初始化所有特征点ID
+        if prev_keypoints is None:
+            point_ids = np.arange(next_id, next_id + len(keypoints), dtype=np.int64)
+            next_id += len(keypoints)
+        else:
+            # 后续帧：通过特征匹配来关联特征点
+            if prev_descriptors is not None and descriptors is not None:
+                start_match = time.time()
+                if use_cuda:
+                    prev_idx, curr_idx = match_indices(cross_check_match(bf, prev_descriptors, descriptors))
+                elif use_popcount and len(prev_descriptors) * len(descriptors) <= bf_max_pairs:
+                    prev_idx, curr_idx = popcount_cross_match(prev_descriptors, descriptors)
+                else:
+                    if prev_index is None:
+                        prev_index = build_lsh(prev_descriptors)
+                    curr_index = build_lsh(descriptors)
+                    prev_idx, curr_idx = match_indices(
+                        lsh_cross_match(prev_index, curr_index, prev_descriptors, descriptors))
+                match_time = (time.time() - start_match) * 1000
+                
+                # 创建新的ID映射：匹配上的继承上一帧ID
+                known = prev_idx < len(point_ids)
+                matched_count = int(known.sum())
+                new_point_ids = np.full(len(keypoints), -1, np.int64)
+                new_point_ids[curr_idx[known]] = point_ids[prev_idx[known]]
+                
+                # 为未匹配的特征点分配新ID
+                unmatched = new_point_ids == -1
+                n_new = int(unmatched.sum())
+                new_point_ids[unmatched] = np.arange(next_id, next_id + n_new)
+                next_id += n_new
+                
+                point_ids = new_point_ids
+                print(f"[帧 {frame_idx}] 匹配 {matched_count}/{len(prev_idx)} 个特征点 | 耗时: {match_time:.2f}ms")
+        
+        # 更新上一帧数据
+        prev_keypoints = keypoints
+        prev_descriptors = descriptors
+        if not use_cuda:
+            prev_index = curr_index
+        
+        if not put_until(out_q, (frame, frame_idx, pts, point_ids, detect_time), stop):
+            return
+
+def draw_result(frame, frame_idx, pts, point_ids, detect_time):
+    """在帧上画特征点、ID 和信息栏"""
+    if pts is None:
+        info = f"Frame:{frame_idx} | Features:0"
+        cv2.putText(frame, info, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 
+                   0.7, (0, 0, 255), 2)
+        return
+    
+    # 绘制特征点和ID
+    draw_disks(frame, pts, point_radius, (0, 255, 0))
+    # 绘制ID（画在所有圆点之上）
+    label_step = -(-len(pts) // max_labels)
+    label_pos = (pts[::label_step] + (8, -8)).tolist()
+    label_ids = point_ids[:len(pts):label_step].tolist()
+    label_ids += [-1] * (len(label_pos) - len(label_ids))
+    for (x, y), pt_id in zip(label_pos, label_ids):
+        cv2.putText(frame, str(pt_id), (x, y),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 0), 1)
+    
+    # 显示信息
+    info = f"Frame:{frame_idx} | Features:{len(pts)} | Time:{detect_time:.1f}ms"
+    cv2.putText(frame, info, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 
+               0.7, (0, 255, 255), 2)
+
+def stop_pipeline(stop, threads, cap):
+    stop.set()
+    for t in threads:
+        t.join()
+    cap.release()
 
 while True:
     cap = cv2.VideoCapture(video_file)
@@ -29,101 +325,34 @@ while True:
     
     paused = False
     video_ended = False
-    frame_idx = 0
-    
-    # 初始化跟踪数据
-    prev_keypoints = None
-    prev_descriptors = None
-    point_ids = {}         # keypoint索引 -> ID的映射
-    next_id = 0            # 下一个可用的ID
     
-    # 创建BFMatcher用于特征匹配
-    bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+    # 解码、ORB、显示流水线并行：解码线程 -> frame_q -> ORB 线程 -> result_q -> 主线程画图显示
+    stop = threading.Event()
+    frame_q = queue.Queue(maxsize=queue_size)
+    result_q = queue.Queue(maxsize=queue_size)
+    threads = [threading.Thread(target=capture_loop, args=(cap, first_frame, frame_q, stop), daemon=True),
+               threading.Thread(target=orb_loop, args=(frame_q, result_q, stop), daemon=True)]
+    for t in threads:
+        t.start()
     
     while True:
         if not paused and not video_ended:
-            ret, frame = cap.read()
-            if not ret:
+            try:
+                item = result_q.get(timeout=0.1)
+            except queue.Empty:
+                item = () if threads[1].is_alive() else None  # ORB 线程异常退出时按视频结束处理
+            if item is None:
                 print("视频结束，按 'r' 重播 | 按 'q' 退出")
                 video_ended = True
-            else:
-                frame_idx += 1
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                result = frame.copy()
-                
-                # ORB检测特征点
-                start_time = time.time()
-                keypoints, descriptors = orb.detectAndCompute(gray, None)
-                detect_time = (time.time() - start_time) * 1000  # 转换为毫秒
-                
-                if keypoints:
-                    print(f"[帧 {frame_idx}] 检测到 {len(keypoints)} 个ORB特征点 | 耗时: {detect_time:.2f}ms")
-                    
-                    # 第一帧：初始化所有特征点ID
-                    if prev_keypoints is None:
-                        for i in range(len(keypoints)):
-                            point_ids[i] = next_id
-                            next_id += 1
-                    else:
-                        # 后续帧：通过特征匹配来关联特征点
-                        if prev_descriptors is not None and descriptors is not None:
-                            start_match = time.time()
-                            matches = bf.match(prev_descriptors, descriptors)
-                            match_time = (time.time() - start_match) * 1000
-                            
-                            # 创建新的ID映射
-                            new_point_ids = {}
-                            matched_count = 0
-                            
-                            for match in matches:
-                                prev_idx = match.queryIdx
-                                curr_idx = match.trainIdx
-                                if prev_idx in point_ids:
-                                    new_point_ids[curr_idx] = point_ids[prev_idx]
-                                    matched_count += 1
-                            
-                            # 为未匹配的特征点分配新ID
-                            for i in range(len(keypoints)):
-                                if i not in new_point_ids:
-                                    new_point_ids[i] = next_id
-                                    next_id += 1
-                            
-                            point_ids = new_point_ids
-                            print(f"[帧 {frame_idx}] 匹配 {matched_count}/{len(matches)} 个特征点 | 耗时: {match_time:.2f}ms")
-                    
-                    # 绘制特征点和ID
-                    for i, kp in enumerate(keypoints):
-                        x, y = int(kp.pt[0]), int(kp.pt[1])
-                        pt_id = point_ids.get(i, -1)
-                        
-                        # 绘制特征点
-                        cv2.circle(result, (x, y), 5, (0, 255, 0), -1)
-                        # 绘制ID
-                        cv2.putText(result, str(pt_id), (x + 8, y - 8),
-                                   cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 0), 1)
-                    
-                    # 显示信息
-                    info = f"Frame:{frame_idx} | Features:{len(keypoints)} | Time:{detect_time:.1f}ms"
-                    cv2.putText(result, info, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 
-                               0.7, (0, 255, 255), 2)
-                    
-                    # 更新上一帧数据
-                    prev_keypoints = keypoints
-                    prev_descriptors = descriptors
-                else:
-                    print(f"[帧 {frame_idx}] 未检测到特征点")
-                    info = f"Frame:{frame_idx} | Features:0"
-                    cv2.putText(result, info, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 
-                               0.7, (0, 0, 255), 2)
-                
-                # 显示
-                cv2.imshow('ORB Feature Points', result)
+            elif item:
+                draw_result(*item)
+                cv2.imshow('ORB Feature Points', item[0])
         
         # 处理按键
         key = cv2.waitKey(30 if not paused else 100) & 0xFF
         
         if key == ord('q'):
-            cap.release()
+            stop_pipeline(stop, threads, cap)
             cv2.destroyAllWindows()
             sys.exit(0)
         elif key == ord(' '):
@@ -133,14 +362,11 @@ while True:
             break
         elif key == ord('+') or key == ord('='):
             max_features = min(2000, max_features + 100)
-            orb = cv2.ORB_create(nfeatures=max_features)
             print(f"最大特征点数: {max_features}")
         elif key == ord('-') or key == ord('_'):
             max_features = max(100, max_features - 100)
-            orb = cv2.ORB_create(nfeatures=max_features)
             print(f"最大特征点数: {max_features}")
     
-    cap.release()
+    stop_pipeline(stop, threads, cap)
 
 cv2.destroyAllWindows()
-
@@ -1,14 +1,127 @@
 #!/usr/bin/env python3
 import argparse
 import os
+import shutil
+import subprocess
 import sys
 
 import cv2
 
 
-def open_writer(out_path: str, w: int, h: int, fps: float) -> cv2.VideoWriter:
+# FFmpeg 软件编码也开多线程（threads=0 由 libavcodec 按核数决定）
+os.environ.setdefault("OPENCV_FFMPEG_WRITER_OPTIONS", "threads;0")
+
+# 请求 FFmpeg 后端用硬件编解码（NVDEC/NVENC、VAAPI、QSV 等），没有可用硬件时自动退回软件
+HW_PARAMS = [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+
+# OpenCV 带 GStreamer 时 .mp4 直接走 GStreamer H.264 编码管线，按顺序试：
+# Jetson NVENC、桌面 N 卡 NVENC、多线程 x264（CPU）
+HAS_GSTREAMER = any(line.strip().startswith("GStreamer:") and "YES" in line
+                    for line in cv2.getBuildInformation().splitlines())
+GST_H264_ENCODERS = [
+    (True, "video/x-raw,format=BGRx ! nvvidconv ! nvv4l2h264enc"),
+    (True, "nvh264enc"),
+    (False, "x264enc speed-preset=ultrafast threads=0"),
+]
+
+
+def open_gst_writer(out_path: str, w: int, h: int, fps: float, hw: bool) -> cv2.VideoWriter:
+    # 路径加引号（内部的 \ 和 " 转义），含空格或 ! 的路径不会被拆成管线元素
+    location = out_path.replace("\\", "\\\\").replace('"', '\\"')
+    for needs_hw, encoder in GST_H264_ENCODERS:
+        if needs_hw and not hw:
+            continue
+        pipeline = (f"appsrc ! video/x-raw,format=BGR ! videoconvert ! {encoder} ! "
+                    f'h264parse ! mp4mux ! filesink location="{location}"')
+        vw = cv2.VideoWriter(pipeline, cv2.CAP_GSTREAMER, 0, fps, (w, h), True)
+        if vw.isOpened():
+            return vw
+    return cv2.VideoWriter()  # unopened
+
+
+# 装了 ffmpeg 命令行时 .mp4 通过管道交给 ffmpeg 子进程编码 H.264：NVENC 优先，其次多线程 x264 ultrafast
+FFMPEG = shutil.which("ffmpeg")
+FFMPEG_H264_ENCODERS = [
+    (True, ["-c:v", "h264_nvenc"]),
+    (False, ["-c:v", "libx264", "-preset", "ultrafast", "-tune", "zerolatency"]),
+]
+
+
+class FFmpegWriter:
+    """BGR 帧经 stdin 管道喂给 ffmpeg 子进程编码，接口同 cv2.VideoWriter（write/release/isOpened）"""
+
+    def __init__(self, out_path: str, w: int, h: int, fps: float, codec_args: list):
+        cmd = [FFMPEG, "-hide_banner", "-loglevel", "error", "-y",
+               "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{w}x{h}", "-r", f"{fps}", "-i", "-",
+               *codec_args, "-pix_fmt", "yuv420p", out_path]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        self.failed = False  # ffmpeg 提前退出（如输出路径不可写）或退出码非 0
+
+    def isOpened(self) -> bool:
+        return not self.failed and self.proc.poll() is None
+
+    def write(self, frame) -> None:
+        if self.failed:
+            return
+        try:
+            self.proc.stdin.write(frame.data)
+        except (BrokenPipeError, OSError):  # ffmpeg 已退出，后面的帧不再写
+            self.failed = True
+
+    def release(self) -> None:
+        try:
+            self.proc.stdin.close()  # 关闭管道，ffmpeg 收尾写完文件
+        except (BrokenPipeError, OSError):
+            self.failed = True
+        if self.proc.wait() != 0:
+            self.failed = True
+
+
+def ffmpeg_encoder_works(codec_args: list) -> bool:
+    """用一帧测试画面试编码，确认编码器可用（NVENC 还要求有 N 卡和驱动）"""
+    cmd = [FFMPEG, "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", "color=s=256x256",
+           "-frames:v", "1", *codec_args, "-f", "null", "-"]
+    return subprocess.run(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.DEVNULL).returncode == 0
+
+
+def open_ffmpeg_writer(out_path: str, w: int, h: int, fps: float, hw: bool):
+    if w % 2 or h % 2:  # yuv420p 要求宽高为偶数
+        return None
+    for needs_hw, codec_args in FFMPEG_H264_ENCODERS:
+        if needs_hw and not hw:
+            continue
+        if ffmpeg_encoder_works(codec_args):
+            return FFmpegWriter(out_path, w, h, fps, codec_args)
+    return None
+
+
+def open_capture(path: str, hw: bool) -> cv2.VideoCapture:
+    if hw:
+        cap = cv2.VideoCapture(path, cv2.CAP_FFMPEG, HW_PARAMS)
+        if cap.isOpened():
+            return cap
+    return cv2.VideoCapture(path)
+
+
+def open_writer(out_path: str, w: int, h: int, fps: float, hw: bool = False,
+                hw_writer: bool = False) -> "cv2.VideoWriter | FFmpegWriter":
     ext = os.path.splitext(out_path)[1].lower()
     fourcc_candidates = ["mp4v", "avc1"] if ext in [".mp4", ".m4v"] else ["XVID", "MJPG", "mp4v"]
+    if HAS_GSTREAMER and ext in [".mp4", ".m4v"]:
+        vw = open_gst_writer(out_path, w, h, fps, hw)
+        if vw.isOpened():
+            return vw
+    if FFMPEG and ext in [".mp4", ".m4v"]:
+        vw = open_ffmpeg_writer(out_path, w, h, fps, hw)
+        if vw is not None:
+            return vw
+    if hw and hw_writer and ext in [".mp4", ".m4v"]:
+        # 硬件编码器只做 H.264，先试 avc1，不行再走软件编码候选；
+        # 需要自带硬件编码的 FFmpeg，pip 版 OpenCV 会报 unsupported parameters，所以要显式打开
+        vw = cv2.VideoWriter(out_path, cv2.CAP_FFMPEG, cv2.VideoWriter_fourcc(*"avc1"), fps, (w, h), HW_PARAMS)
+        if vw.isOpened():
+            return vw
     for code in fourcc_candidates:
         vw = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*code), fps, (w, h))
         if vw.isOpened():
@@ -16,6 +129,13 @@ def open_writer(out_path: str, w: int, h: int, fps: float) -> cv2.VideoWriter:
     return cv2.VideoWriter()  # unopened
 
 
+def pick_interpolation(src_w: int, src_h: int, w: int, h: int) -> int:
+    """缩小不到 2 倍（或放大）时 INTER_LINEAR 和 INTER_AREA 看不出差别，但快好几倍；缩小更多时用 INTER_AREA 防混叠"""
+    if src_w < 2 * w and src_h < 2 * h:
+        return cv2.INTER_LINEAR
+    return cv2.INTER_AREA
+
+
 def main() -> int:
     ap = argparse.ArgumentParser(description="Resize a video and save (simple).")
     ap.add_argument("input", nargs="?", default="moving_mosquito_bedroom_original.mp4", help="input video path (default: input.mp4)")
@@ -23,6 +143,9 @@ def main() -> int:
     ap.add_argument("--w", type=int, default=640, help="target width (default: 640)")
     ap.add_argument("--h", type=int, default=480, help="target height (default: 480)")
     ap.add_argument("--fps", type=float, default=0.0, help="override fps (default: use input fps)")
+    ap.add_argument("--no-gpu", action="store_true", help="disable hardware decode/encode (default: use if available)")
+    ap.add_argument("--hw-writer", action="store_true",
+                    help="also try OpenCV's FFmpeg hardware H.264 writer (needs an OpenCV FFmpeg build with NVENC/VAAPI/QSV)")
     args = ap.parse_args()
 
     if not os.path.exists(args.input):
@@ -34,27 +157,40 @@ def main() -> int:
         ext = ext if ext else ".mp4"
         args.output = f"{base}_{args.w}x{args.h}{ext}"
 
-    cap = cv2.VideoCapture(args.input)
+    hw = not args.no_gpu
+    cap = open_capture(args.input, hw)
     if not cap.isOpened():
         print(f"✗ 无法打开输入视频: {args.input}")
         return 1
 
     fps = args.fps or (cap.get(cv2.CAP_PROP_FPS) or 30.0)
-    out = open_writer(args.output, args.w, args.h, fps)
+    out = open_writer(args.output, args.w, args.h, fps, hw, args.hw_writer)
     if not out.isOpened():
         print(f"✗ 无法创建输出视频: {args.output}")
         return 2
 
     n = 0
+    frame = None
+    small = None  # 复用缩放输出缓冲
+    interp = None
     while True:
-        ok, frame = cap.read()
-        if not ok:
+        ok, frame = cap.read(frame)
+        if not ok or not out.isOpened():
             break
-        out.write(cv2.resize(frame, (args.w, args.h), interpolation=cv2.INTER_AREA))
+        if frame.shape[1] == args.w and frame.shape[0] == args.h:
+            out.write(frame)
+        else:
+            if interp is None:
+                interp = pick_interpolation(frame.shape[1], frame.shape[0], args.w, args.h)
+            small = cv2.resize(frame, (args.w, args.h), dst=small, interpolation=interp)
+            out.write(small)
         n += 1
 
     out.release()
     cap.release()
+    if isinstance(out, FFmpegWriter) and out.failed:
+        print(f"✗ 无法创建输出视频: {args.output}（ffmpeg 编码失败）")
+        return 2
     print(f"✓ 完成: {args.input} -> {args.output} | size={args.w}x{args.h} fps={fps:.2f} frames={n}")
     return 0
 
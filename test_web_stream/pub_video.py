@@ -2,14 +2,51 @@
 """HTTP/MJPEG 摄像头推流（局域网可访问，尽量简洁）"""
 
 import argparse
+import threading
 import time
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlsplit
 
 import cv2
 
+try:
+    from nvidia import nvimgcodec
+except ImportError:  # 没有 nvImageCodec 时用 cv2.imencode（CPU）
+    nvimgcodec = None
+
+try:
+    from turbojpeg import TJPF_BGR, TJSAMP_420, TurboJPEG
+    TURBO = TurboJPEG()  # 直接调用 libjpeg-turbo（SIMD），导入时初始化一次
+except (ImportError, OSError, RuntimeError):  # 没有 PyTurboJPEG 或找不到 libturbojpeg 时用 cv2.imencode
+    TURBO = None
+
 CAP = None
+BROKER = None
 JPEG_QUALITY = 80
+MAX_STREAM_SIZES = 4  # 同时维护的输出尺寸数量上限（含原始分辨率），超出时新尺寸按原始分辨率推
+USE_NVJPEG = nvimgcodec is not None
+USE_TURBOJPEG = TURBO is not None  # False 时 CPU 编码走 cv2.imencode
+
+_local = threading.local()  # 每个线程缓存自己的编码器和 RGB 缓冲
+
+
+def encode_jpeg(frame):
+    """BGR 帧编码成 JPEG bytes；优先 GPU 的 NVJPEG，其次 libjpeg-turbo，失败返回 None"""
+    if USE_NVJPEG:
+        if not hasattr(_local, "encoder"):
+            _local.encoder = nvimgcodec.Encoder()
+            _local.params = nvimgcodec.EncodeParams(
+                quality_type=nvimgcodec.QualityType.QUALITY, quality_value=JPEG_QUALITY)
+            _local.rgb = None
+        _local.rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=_local.rgb)  # nvImageCodec 按 RGB 解释
+        jpg = _local.encoder.encode(_local.rgb, "jpeg", params=_local.params)
+        return bytes(jpg) if jpg is not None else None
+    if USE_TURBOJPEG:
+        # 与 cv2.imencode 默认一致用 4:2:0 色度抽样
+        return TURBO.encode(frame, quality=JPEG_QUALITY, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+    ok, buf = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), int(JPEG_QUALITY)])
+    return buf.tobytes() if ok else None
 
 
 INDEX_HTML = b"""<!doctype html><html><body style="margin:0;background:#111;display:grid;place-items:center;height:100vh">
@@ -17,6 +54,134 @@ INDEX_HTML = b"""<!doctype html><html><body style="margin:0;background:#111;disp
 </body></html>"""
 
 
+def parse_size(query):
+    """?w=320（可选 &h=240，不给 h 时按原始宽高比）-> (w, h)，h=0 表示按比例；没有或不合法时返回 None（原始分辨率）"""
+    try:
+        w = int(query["w"][0])
+        h = int(query["h"][0]) if "h" in query else 0
+    except (KeyError, ValueError):
+        return None
+    if w <= 0 or h < 0:
+        return None
+    return w, h
+
+
+def clamp_size(size, fw, fh):
+    """请求尺寸落到 fw×fh 原图上的实际输出尺寸（只缩不放，h=0 按比例）；等于原图时返回 None"""
+    if size is None:
+        return None
+    w, h = size
+    w = min(w, fw)
+    h = min(h or max(1, round(fh * w / fw)), fh)
+    return None if (w, h) == (fw, fh) else (w, h)
+
+
+class StreamVariant:
+    """一种输出尺寸的最新一帧；size 为 None 表示原始分辨率"""
+
+    def __init__(self, size):
+        self.size = size
+        self.latest = b""  # 分隔符 + 头 + JPEG + CRLF，客户端一次 write 发完
+        self.seq = 0
+        self.clients = 0
+        self.small = None  # 缩放输出缓冲，只在采集线程里用
+        self.dropped = False  # 缩放/编码失败后被移除，订阅它的客户端随之断开
+
+    def scaled(self, frame):
+        """按请求尺寸缩小（只缩不放），JPEG 编码耗时和带宽都与像素数成正比"""
+        fh, fw = frame.shape[:2]
+        size = clamp_size(self.size, fw, fh)  # 宽高都不超过原图，避免超大尺寸
+        if size is None:
+            return frame
+        self.small = cv2.resize(frame, size, dst=self.small, interpolation=cv2.INTER_AREA)
+        return self.small
+
+
+class FrameBroker:
+    """唯一的采集线程：读摄像头，每种请求尺寸缩放、编码一次，把最新一帧的 multipart 分段分发给所有客户端"""
+
+    def __init__(self, cap):
+        self.cap = cap
+        self.variants = {}  # 实际输出尺寸（clamp_size 之后）-> StreamVariant
+        self.frame_size = None  # 最近一帧的 (w, h)，订阅时按它折算请求尺寸
+        self.running = True
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        frame = None
+        while self.running:
+            ok, frame = self.cap.read(frame)
+            if not ok:
+                time.sleep(0.05)
+                continue
+            self.frame_size = (frame.shape[1], frame.shape[0])
+            with self.cond:
+                active = [v for v in self.variants.values() if v.clients]
+            if not active:  # 没人看时只读帧保持缓冲新鲜，不编码
+                continue
+            parts = []
+            for variant in active:
+                try:
+                    jpg = encode_jpeg(variant.scaled(frame))
+                except Exception as e:  # 某个尺寸出错只丢掉这个尺寸，不影响其他客户端
+                    print(f"尺寸 {variant.size} 编码失败，已移除: {e}")
+                    self._drop(variant)
+                    continue
+                if jpg is not None:
+                    parts.append((variant, b"".join((b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: ",
+                                                     str(len(jpg)).encode(), b"\r\n\r\n", jpg, b"\r\n"))))
+            with self.cond:
+                for variant, part in parts:
+                    variant.latest = part
+                    variant.seq += 1
+                self.cond.notify_all()
+
+    def _drop(self, variant):
+        with self.cond:
+            variant.dropped = True
+            if self.variants.get(variant.size) is variant:
+                del self.variants[variant.size]
+            self.cond.notify_all()
+
+    def subscribe(self, size):
+        """登记一个客户端，返回 (variant, 当前 seq)"""
+        if self.frame_size is not None:  # 折算成实际输出尺寸，超大或等于原图的请求共用同一份编码
+            size = clamp_size(size, *self.frame_size)
+        with self.cond:
+            if size not in self.variants:
+                if len(self.variants) >= MAX_STREAM_SIZES:
+                    # 先清掉没人看的尺寸，还满就退回原始分辨率
+                    for key in [k for k, v in self.variants.items() if not v.clients]:
+                        del self.variants[key]
+                if len(self.variants) >= MAX_STREAM_SIZES:
+                    size = None
+                self.variants.setdefault(size, StreamVariant(size))
+            variant = self.variants[size]
+            variant.clients += 1
+            return variant, variant.seq
+
+    def unsubscribe(self, variant):
+        with self.cond:
+            variant.clients -= 1
+
+    def wait_next(self, variant, seq, timeout=1.0):
+        """等比 seq 新的一帧，返回 (seq, part)；超时或停止时 part 为 None"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: variant.seq > seq or variant.dropped or not self.running, timeout):
+                return seq, None
+            if variant.dropped or not self.running:
+                return seq, None
+            return variant.seq, variant.latest
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join(timeout=1.0)
+
+
 class Server(ThreadingMixIn, HTTPServer):
     daemon_threads = True
 
@@ -26,7 +191,8 @@ class Handler(BaseHTTPRequestHandler):
         return
 
     def do_GET(self):
-        if self.path in ("/", "/index.html"):
+        url = urlsplit(self.path)
+        if url.path in ("/", "/index.html"):
             self.send_response(200)
             self.send_header("Content-Type", "text/html; charset=utf-8")
             self.send_header("Content-Length", str(len(INDEX_HTML)))
@@ -34,7 +200,7 @@ class Handler(BaseHTTPRequestHandler):
             self.wfile.write(INDEX_HTML)
             return
 
-        if self.path != "/stream.mjpg":
+        if url.path != "/stream.mjpg":
             self.send_response(404)
             self.end_headers()
             return
@@ -45,23 +211,17 @@ class Handler(BaseHTTPRequestHandler):
         self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
         self.end_headers()
 
-        params = [int(cv2.IMWRITE_JPEG_QUALITY), int(JPEG_QUALITY)]
+        variant, seq = BROKER.subscribe(parse_size(parse_qs(url.query)))
         try:
-            while True:
-                ok, frame = CAP.read()
-                if not ok:
-                    time.sleep(0.05)
-                    continue
-                ok, buf = cv2.imencode(".jpg", frame, params)
-                if not ok:
+            while BROKER.running and not variant.dropped:
+                seq, part = BROKER.wait_next(variant, seq)
+                if part is None:
                     continue
-                jpg = buf.tobytes()
-                self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\n")
-                self.wfile.write(f"Content-Length: {len(jpg)}\r\n\r\n".encode())
-                self.wfile.write(jpg)
-                self.wfile.write(b"\r\n")
+                self.wfile.write(part)
         except (BrokenPipeError, ConnectionResetError):
             return
+        finally:
+            BROKER.unsubscribe(variant)
 
 
 def main():
@@ -72,10 +232,12 @@ def main():
     p.add_argument("--width", type=int, default=640)
     p.add_argument("--height", type=int, default=480)
     p.add_argument("--quality", type=int, default=80)
+    p.add_argument("--no-gpu", action="store_true", help="不用 NVJPEG，JPEG 编码走 CPU")
     args = p.parse_args()
 
-    global CAP, JPEG_QUALITY
+    global CAP, BROKER, JPEG_QUALITY, USE_NVJPEG
     JPEG_QUALITY = max(1, min(100, args.quality))
+    USE_NVJPEG = USE_NVJPEG and not args.no_gpu
 
     CAP = cv2.VideoCapture(args.cam)
     CAP.set(cv2.CAP_PROP_FRAME_WIDTH, args.width)
@@ -83,9 +245,11 @@ def main():
     if not CAP.isOpened():
         print(f"无法打开摄像头: {args.cam}")
         return 1
+    BROKER = FrameBroker(CAP)
 
     srv = Server((args.host, args.port), Handler)
-    print(f"已启动: http://{args.host}:{args.port}/  (本机可用 127.0.0.1)")
+    jpeg_backend = "NVJPEG" if USE_NVJPEG else "libjpeg-turbo" if USE_TURBOJPEG else "cv2"
+    print(f"已启动: http://{args.host}:{args.port}/  (本机可用 127.0.0.1) | JPEG: {jpeg_backend}")
     print("按 Ctrl+C 退出")
     try:
         srv.serve_forever()
@@ -93,6 +257,7 @@ def main():
         pass
     finally:
         srv.server_close()
+        BROKER.stop()
         CAP.release()
     return 0
 
@@ -0,0 +1,54 @@
+"""ClipSaver 后台写线程：写得比采集慢时，写出的片段和同步写入逐帧一致"""
+
+import importlib.util
+import os
+import time
+
+import numpy as np
+import pytest
+
+_PATH = os.path.join(os.path.dirname(__file__), "..", "sense_test", "follow_moving_mosquitos.py")
+_spec = importlib.util.spec_from_file_location("follow_moving_mosquitos", _PATH)
+fmm = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(fmm)
+
+
+class SlowWriter:
+    """记录写入帧的拷贝；delay 模拟编码耗时"""
+
+    def __init__(self, clips, delay):
+        self.frames = []
+        self.delay = delay
+        clips.append(self.frames)
+
+    def isOpened(self):
+        return True
+
+    def write(self, frame):
+        time.sleep(self.delay)
+        self.frames.append(frame.copy())
+
+    def release(self):
+        pass
+
+
+def run_clips(monkeypatch, pre_n, post_n, queue_n, delay, detected):
+    clips = []
+    monkeypatch.setattr(fmm, "open_clip_writer", lambda *a: SlowWriter(clips, delay))
+    saver = fmm.ClipSaver("unused", pre_n, post_n, queue_n)
+    frame = np.empty((4, 6, 3), np.uint8)
+    for i, det in enumerate(detected):
+        frame.fill(i % 256)
+        saver.push(frame, det, 30.0, 6, 4, "t", i, boxes=[(0, 0, 2, 2)] if det else ())
+    saver.close()
+    return [[int(f[3, 5, 0]) for f in clip] for clip in clips], clips
+
+
+@pytest.mark.parametrize("pre_n, post_n, queue_n", [(30, 5, 30), (3, 5, 2), (0, 3, 4), (5, 2, 1)])
+def test_queued_clips_match_sync(monkeypatch, pre_n, post_n, queue_n):
+    detected = [i % 40 in (10, 11, 12, 20) or i % 97 == 50 for i in range(200)]
+    expected, expected_frames = run_clips(monkeypatch, pre_n, post_n, 0, 0.0, detected)
+    got, got_frames = run_clips(monkeypatch, pre_n, post_n, queue_n, 0.002, detected)
+    assert got == expected
+    for a, b in zip(expected_frames, got_frames):
+        assert all(np.array_equal(x, y) for x, y in zip(a, b))